@@ -0,0 +1,373 @@
+"""Offline broadcast benchmark - fake Telegram client + local Mongo
+
+Live bot aur production DB ke bina BroadcastSystem ka throughput naapo.
+Audience ek local mongod (ya koi bhi throwaway Mongo) me synthetic users
+aur chats se seed hoti hai - alag bench DBs me, music bot ke DB me nahi.
+Telegram ki jagah FakeClient hai: latency, FloodWait aur blocked users
+configurable hain.
+
+Usage:
+    python bench.py --users 100000 --chats 10000 --latency-ms 40
+    python bench.py --users 10000000 --reuse --max-seconds 120
+    python bench.py --server-rate 30 --rate 60     # AIMD ko FloodWaits ke saath dekho
+
+Report: msgs/s, p50/p99 send latency, peak RSS aur time-to-first-send.
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import deque
+from pymongo import MongoClient
+from pyrogram import raw, utils
+from pyrogram.enums import ChatType
+from pyrogram.errors import FloodWait, UserIsBlocked
+from pyrogram.parser import Parser
+from pyrogram.types import Chat, Message
+
+# Bench DBs - bot import hone se pehle set, taaki kabhi asli DB na chhua jaye
+BENCH_ANON_DB = 'BroadcastBench'
+BENCH_BOT_DB = 'BroadcastBenchBot'
+SEED_BATCH = 50000
+
+# Synthetic IDs - modular permutation, taaki insert order sorted na ho aur memory na lage
+USER_ID_BASE = 100000000
+USER_ID_SPACE = 2000000011
+GROUP_ID_BASE = -1000000000001
+GROUP_ID_SPACE = 1000000007
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline broadcast benchmark")
+    parser.add_argument('--mongo-url', default=os.getenv('BENCH_MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--users', type=int, default=10000, help="tgusersdb me users (10^4 - 10^7)")
+    parser.add_argument('--chats', type=int, default=1000, help="chats collection me groups")
+    parser.add_argument('--assistant-ratio', type=float, default=0.5, help="groups ka hissa jo assistants me bhi hai")
+    parser.add_argument('--reuse', action='store_true', help="pehle se seeded bench DB use karo")
+    parser.add_argument('--latency-ms', type=float, default=30.0, help="fake send latency (mean)")
+    parser.add_argument('--jitter', type=float, default=0.5, help="latency jitter (mean ka hissa)")
+    parser.add_argument('--flood-ratio', type=float, default=0.0, help="sends jinpar random FloodWait aaye")
+    parser.add_argument('--flood-seconds', type=int, default=2)
+    parser.add_argument('--server-rate', type=float, default=0.0, help="fake server limit (msg/s) - upar FloodWait, 0 = off")
+    parser.add_argument('--blocked-ratio', type=float, default=0.02, help="chats jinhone bot block kiya hai")
+    parser.add_argument('--rate', type=float, default=0.0, help="send rate ceiling, 0 = limiter band (engine overhead naapo)")
+    parser.add_argument('--messages', type=int, default=1, help="ek job me messages (queued broadcasts ka batch)")
+    parser.add_argument('--workers', type=int, default=0, help="BROADCAST_WORKERS override")
+    parser.add_argument('--snapshot', action='store_true', help="audience snapshot file se padho (timing se pehle build hoti hai)")
+    parser.add_argument('--max-seconds', type=float, default=0.0, help="itne seconds baad job cancel karo, 0 = poora chalao")
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+def synthetic_ids(base, space, count, step=7919):
+    """`count` unique IDs - (i * step) % space ek permutation hai"""
+    for i in range(count):
+        yield base + (i * step) % space if base > 0 else base - (i * step) % space
+
+def seed(mongo_url, users, chats, assistant_ratio, reuse):
+    """Bench audience seed karo (sync, benchmark se pehle)"""
+    client = MongoClient(mongo_url)
+    db = client[BENCH_ANON_DB]
+    if reuse and db.tgusersdb.estimated_document_count() == users and db.chats.estimated_document_count() == chats:
+        print(f"♻️ Reusing seeded audience: {users} users, {chats} chats")
+        client.close()
+        return
+
+    client.drop_database(BENCH_ANON_DB)
+    started = time.perf_counter()
+
+    def insert(collection, field, ids):
+        batch = []
+        for chat_id in ids:
+            batch.append({field: chat_id})
+            if len(batch) >= SEED_BATCH:
+                collection.insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            collection.insert_many(batch, ordered=False)
+
+    insert(db.tgusersdb, 'user_id', synthetic_ids(USER_ID_BASE, USER_ID_SPACE, users))
+    insert(db.chats, 'chat_id', synthetic_ids(GROUP_ID_BASE, GROUP_ID_SPACE, chats))
+    # Assistants ke groups zyada tar chats me bhi hain - merge dedup ka kaam
+    insert(db.assistants, 'chat_id', synthetic_ids(GROUP_ID_BASE, GROUP_ID_SPACE, int(chats * assistant_ratio)))
+
+    print(f"🌱 Seeded {users} users, {chats} chats in {time.perf_counter() - started:.1f}s")
+    client.close()
+
+class LatencySample:
+    """Send latencies ka reservoir sample - 10^7 sends par bhi memory fixed"""
+    def __init__(self, size=100000):
+        self.size = size
+        self.values = []
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+            return
+        i = random.randrange(self.count)
+        if i < self.size:
+            self.values[i] = value
+
+    def percentile(self, p):
+        if not self.values:
+            return 0.0
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+class FakeStorage:
+    """Pyrogram session jaisa peers table - in-memory SQLite"""
+    def __init__(self):
+        self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE peers (id INTEGER PRIMARY KEY, access_hash INTEGER, type INTEGER NOT NULL, "
+            "username TEXT, phone_number TEXT, "
+            "last_update_on INTEGER NOT NULL DEFAULT (CAST(STRFTIME('%s', 'now') AS INTEGER)))"
+        )
+
+    async def update_peers(self, peers):
+        self.conn.executemany(
+            "REPLACE INTO peers (id, access_hash, type, username, phone_number) VALUES (?, ?, ?, ?, ?)",
+            peers
+        )
+
+class FakeSession:
+    def __init__(self, client):
+        self.client = client
+
+    async def invoke(self, query, sleep_threshold=None):
+        return await self.client.send(query)
+
+class FakeClient:
+    """Telegram ki jagah - latency, FloodWait aur blocked users ke saath"""
+    def __init__(self, args):
+        self.parser = Parser(self)
+        self.parse_mode = None
+        self.storage = FakeStorage()
+        self.session = FakeSession(self)
+        self.sleep_threshold = 0
+
+        self.latency = args.latency_ms / 1000
+        self.jitter = args.jitter
+        self.flood_ratio = args.flood_ratio
+        self.flood_seconds = args.flood_seconds
+        self.server_rate = args.server_rate
+        self.blocked = int(args.blocked_ratio * 10000)
+
+        self.recent = deque()
+        self.sends = 0
+        self.first_send = None
+        self.next_id = 0
+
+    def rnd_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    async def delay(self):
+        await asyncio.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def chat_id(self, peer):
+        if isinstance(peer, raw.types.InputPeerUser):
+            return peer.user_id
+        if isinstance(peer, raw.types.InputPeerChannel):
+            return utils.get_channel_id(peer.channel_id)
+        return -peer.chat_id
+
+    async def send(self, request):
+        """Raw SendMessage/SendMedia - server jaisa jawab do"""
+        if self.first_send is None:
+            self.first_send = time.perf_counter()
+        await self.delay()
+
+        now = time.monotonic()
+        if self.server_rate:
+            # Pichle 1s me server limit se zyada sends - FloodWait
+            while self.recent and self.recent[0] < now - 1:
+                self.recent.popleft()
+            if len(self.recent) >= self.server_rate:
+                raise FloodWait(value=self.flood_seconds)
+            self.recent.append(now)
+        if self.flood_ratio and random.random() < self.flood_ratio:
+            raise FloodWait(value=self.flood_seconds)
+
+        chat_id = self.chat_id(request.peer)
+        if chat_id % 10000 < self.blocked:
+            raise UserIsBlocked()
+
+        self.sends += 1
+        return raw.types.UpdateShortSentMessage(id=self.sends, pts=0, pts_count=0, date=0)
+
+    async def resolve_peer(self, chat_id):
+        await self.delay()
+        peer_type = utils.get_peer_type(chat_id)
+        if peer_type == 'user':
+            return raw.types.InputPeerUser(user_id=chat_id, access_hash=chat_id)
+        if peer_type == 'channel':
+            channel_id = utils.get_channel_id(chat_id)
+            return raw.types.InputPeerChannel(channel_id=channel_id, access_hash=channel_id)
+        return raw.types.InputPeerChat(chat_id=-chat_id)
+
+    async def invoke(self, query):
+        """Peer warm-up requests (GetUsers / GetChannels)"""
+        await self.delay()
+        if isinstance(query, raw.functions.users.GetUsers):
+            return [raw.types.User(id=user.user_id, access_hash=user.user_id) for user in query.id]
+        if isinstance(query, raw.functions.channels.GetChannels):
+            return raw.types.messages.Chats(chats=[
+                raw.types.Channel(
+                    id=channel.channel_id,
+                    title='bench',
+                    photo=raw.types.ChatPhotoEmpty(),
+                    date=0,
+                    access_hash=channel.channel_id,
+                    megagroup=True
+                )
+                for channel in query.id
+            ])
+        raise NotImplementedError(type(query).__name__)
+
+class FakeStatus:
+    """Status message - edits sirf count hote hain"""
+    def __init__(self, chat_id):
+        self.chat = Chat(id=chat_id, type=ChatType.PRIVATE)
+        self.id = 1
+        self.empty = False
+        self.edits = 0
+        self.text = ''
+
+    async def edit(self, text, **kwargs):
+        self.edits += 1
+        self.text = text
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux KB deta hai, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+async def run_bench(bot, args):
+    client = FakeClient(args)
+    system = bot.broadcast_system
+
+    # Bot module ka app fake client se badlo
+    bot.app = client
+    system.peers.client = client
+
+    # Bot jaisa startup - Mongo, indexes, failed chats (jobs/snapshot warm-up nahi)
+    await system.start_services(warm=False)
+
+    if args.rate:
+        system.rate_control.ceiling = args.rate
+        system.limiter.rate = min(system.limiter.rate, args.rate)
+    else:
+        # Limiter band - sirf engine ka apna overhead naapo
+        system.rate_control.ceiling = float('inf')
+        system.limiter.rate = 1e9
+        system.limiter.burst = 10 ** 6
+        system.limiter.tokens = float(system.limiter.burst)
+        system.limiter.chat_interval = 0
+        system.limiter.group_interval = 0
+
+    # Prebuilt snapshot - build timing ke bahar, run sirf mmap se padhta hai
+    if args.snapshot:
+        await system.snapshot.refresh()
+
+    latencies = LatencySample()
+    send_to_chat = system.send_to_chat
+
+    async def timed_send(chat_id, payload):
+        started = time.perf_counter()
+        result = await send_to_chat(chat_id, payload)
+        latencies.add(time.perf_counter() - started)
+        return result
+
+    system.send_to_chat = timed_send
+
+    messages = [
+        Message(id=i + 1, chat=Chat(id=bot.ADMIN_IDS[0], type=ChatType.PRIVATE), text=f"📢 Benchmark broadcast {i + 1}")
+        for i in range(args.messages)
+    ]
+    status = FakeStatus(bot.ADMIN_IDS[0])
+
+    started = time.perf_counter()
+    job_id = await system.scheduler.submit(messages, status)
+    task = system.scheduler.active[job_id]['task']
+
+    if args.max_seconds:
+        try:
+            await asyncio.wait_for(asyncio.shield(task), args.max_seconds)
+        except asyncio.TimeoutError:
+            system.scheduler.cancel(job_id)
+    await task
+    elapsed = time.perf_counter() - started
+
+    job = await system.jobs.get(job_id)
+    counters = job['counters']
+    first_send = (client.first_send - started) if client.first_send else float('nan')
+
+    print("=" * 50)
+    print(f"📊 Benchmark result (job {job_id}, {job['status']})")
+    print("=" * 50)
+    print(f"Chats processed:    {counters['done']}")
+    print(f"Chats delivered:    {counters['success']}")
+    print(f"Messages sent:      {client.sends}")
+    print(f"Failed/Blocked:     {counters['failed']}")
+    print(f"Flood waits:        {system.stats['flood_waits']}")
+    print(f"Wall time:          {elapsed:.2f}s")
+    print(f"Throughput:         {client.sends / elapsed:.1f} msgs/s")
+    print(f"Send latency p50:   {latencies.percentile(50) * 1000:.1f} ms")
+    print(f"Send latency p99:   {latencies.percentile(99) * 1000:.1f} ms")
+    print(f"Time to first send: {first_send * 1000:.1f} ms")
+    print(f"Final send rate:    {f'{system.rate_control.rate:.1f} msg/s' if args.rate else 'unlimited'}")
+    print(f"Audience source:    {'snapshot (' + str(len(system.snapshot)) + ' chats)' if args.snapshot else 'mongo'}")
+    print(f"Peer cache:         {len(system.peers)} ({system.peers.hit_rate:.1f}% hits)")
+    print(f"Peak RSS:           {peak_rss_mb():.1f} MB")
+    print(f"Status edits:       {status.edits}")
+    print(f"Bot log:            {bot.LOG_FILE}")
+    print("=" * 50)
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+
+    seed(args.mongo_url, args.users, args.chats, args.assistant_ratio, args.reuse)
+
+    workdir = tempfile.mkdtemp(prefix='broadcast-bench-')
+
+    # Bot config - import se pehle, bench DBs aur dummy credentials ke saath
+    # Bot ke logs report ke beech nahi - sirf workdir ki JSON lines file me
+    os.environ.update({
+        'TELEGRAM_API_ID': os.getenv('TELEGRAM_API_ID', '1'),
+        'TELEGRAM_API_HASH': os.getenv('TELEGRAM_API_HASH', 'bench'),
+        'TELEGRAM_BOT_TOKEN': os.getenv('TELEGRAM_BOT_TOKEN', '0:bench'),
+        'MONGO_URL': args.mongo_url,
+        'ANON_DB_NAME': BENCH_ANON_DB,
+        'BOT_DB_NAME': BENCH_BOT_DB,
+        'SESSION_STORAGE': 'memory',
+        'MONGO_READ_PREFERENCE': 'primary',
+        'LOG_FILE': os.path.join(workdir, 'broadcast.jsonl'),
+        'LOG_CONSOLE': 'false',
+        # Snapshot band ho toh har run Mongo scan naapta hai - background rebuild timing me nahi ghusta
+        'AUDIENCE_SNAPSHOT': 'true' if args.snapshot else 'false',
+    })
+    if args.workers:
+        os.environ['BROADCAST_WORKERS'] = str(args.workers)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import bot
+
+    # Har run fresh - purane jobs/failed chats aur inactive flags hatao
+    bot.broadcast_system.mongo_client.drop_database(BENCH_BOT_DB)
+    bot.broadcast_system.failed_chats.reactivate_all()
+
+    # failed_chats.json migration kisi asli file ko na uthaye
+    os.chdir(workdir)
+
+    # Bot ke asyncio objects import par bane hain - app.run jaisa default loop use karo
+    asyncio.get_event_loop().run_until_complete(run_bench(bot, args))
+
+if __name__ == "__main__":
+    main()
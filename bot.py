@@ -1,15 +1,37 @@
 import asyncio
+import contextvars
 import os
+import sys
+import atexit
+import tempfile
+import threading
+import bisect
 import json
 import time
-from datetime import datetime
-from pymongo import MongoClient
-from pyrogram import Client, filters
+import heapq
+import itertools
+import functools
+import math
+import mmap
+import pathlib
+import sqlite3
+import uuid
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import MongoClient, ReadPreference, UpdateOne, DeleteOne
+from pyrogram import Client, filters, idle, raw, utils
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message
-from pyrogram.errors import FloodWait, UserIsBlocked, ChatWriteForbidden
-from pyrogram.enums import ChatMemberStatus
+from pyrogram.errors import FloodWait, Flood, InternalServerError, UserIsBlocked, ChatWriteForbidden, MessageNotModified
+from pyrogram.enums import ChatMemberStatus, ChatType, ParseMode
+from pyrogram.storage.sqlite_storage import get_input_peer
 from dotenv import load_dotenv
 
+# Startup timing yahin se - /ready me 'setup' phase
+BOOT_STARTED = time.perf_counter()
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -26,82 +48,2618 @@ ADMIN_IDS = [int(id.strip()) for id in ADMIN_IDS_STR.split(',')]
 ACTIVE_CHATS_FILE = 'chats.json'
 FAILED_CHATS_FILE = 'failed_chats.json'
 
+# Music bot ka DB (audience yahin se aati hai)
+ANON_DB_NAME = os.getenv('ANON_DB_NAME', 'Yukki')
+
+# Bot ka apna data (failed chats etc.) alag DB me - music bot ke collections se bahar
+BOT_DB_NAME = os.getenv('BOT_DB_NAME', 'BroadcastBot')
+
+# Failed chats tracking - itne failures ke baad chat skip hoti hai
+FAILURE_THRESHOLD = int(os.getenv('FAILURE_THRESHOLD', '3'))
+FAILURE_FLUSH_SIZE = int(os.getenv('FAILURE_FLUSH_SIZE', '500'))
+FAILURE_FLUSH_INTERVAL = float(os.getenv('FAILURE_FLUSH_INTERVAL', '2'))
+# Inactive flag itne chat IDs ke batches me - $in query chhoti rahe
+FAILURE_MARK_BATCH = int(os.getenv('FAILURE_MARK_BATCH', '5000'))
+
+# Data layer settings - blocking DB/disk calls thread pool me chalti hain
+DB_THREADS = int(os.getenv('DB_THREADS', '8'))
+DB_TIMEOUT = float(os.getenv('DB_TIMEOUT', '30'))
+MONGO_POOL_SIZE = int(os.getenv('MONGO_POOL_SIZE', '20'))
+MONGO_TIMEOUT_MS = int(os.getenv('MONGO_TIMEOUT_MS', '10000'))
+DB_SCAN_TIMEOUT = float(os.getenv('DB_SCAN_TIMEOUT', '600'))
+
+# Audience scans secondary se padho taaki music bot ka primary free rahe
+MONGO_READ_PREFERENCE = os.getenv('MONGO_READ_PREFERENCE', 'secondaryPreferred')
+ENSURE_INDEXES = os.getenv('ENSURE_INDEXES', 'true').lower() == 'true'
+READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+# /stats settings - exact ($unionWith + $group) ya approx (HyperLogLog)
+STATS_MODE = os.getenv('STATS_MODE', 'exact')
+STATS_CACHE_TTL = float(os.getenv('STATS_CACHE_TTL', '300'))
+
+# Broadcast engine settings
+# Telegram bot limit: ~30 msg/s global, 1 msg/s per chat, 20 msg/min per group
+TELEGRAM_MAX_RATE = 30
+BROADCAST_RATE = min(float(os.getenv('BROADCAST_RATE', '25')), TELEGRAM_MAX_RATE)
+BROADCAST_BURST = int(os.getenv('BROADCAST_BURST', '5'))
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '16'))
+PER_CHAT_INTERVAL = float(os.getenv('PER_CHAT_INTERVAL', '1'))
+GROUP_CHAT_INTERVAL = float(os.getenv('GROUP_CHAT_INTERVAL', '3'))
+
+# Adaptive rate (AIMD) - success par dheere badhao, FloodWait par tezi se ghatao
+BROADCAST_RATE_CEILING = min(float(os.getenv('BROADCAST_RATE_CEILING', str(TELEGRAM_MAX_RATE))), TELEGRAM_MAX_RATE)
+BROADCAST_RATE_FLOOR = float(os.getenv('BROADCAST_RATE_FLOOR', '1'))
+RATE_INCREASE_STEP = float(os.getenv('RATE_INCREASE_STEP', '1'))
+RATE_INCREASE_INTERVAL = float(os.getenv('RATE_INCREASE_INTERVAL', '2'))
+RATE_DECREASE_FACTOR = float(os.getenv('RATE_DECREASE_FACTOR', '0.5'))
+
+# Retry settings - FloodWait / temporary errors ke liye
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '5'))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '2'))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '300'))
+
+# Audience sources - (collection, chat id field)
+AUDIENCE_SOURCES = [
+    ('tgusersdb', 'user_id'),
+    ('assistants', 'chat_id'),
+    ('chats', 'chat_id'),
+]
+AUDIENCE_BATCH_SIZE = int(os.getenv('AUDIENCE_BATCH_SIZE', '5000'))
+
+# Dead chats (blocked / bar bar fail) source documents par hi flag hote hain
+ACTIVE_FILTER = {'inactive': {'$ne': True}}
+
+# Segments - 'since' filter is date field par lagta hai (default _id: ObjectId me creation time hai, aur index hamesha hota hai)
+SEGMENT_KINDS = ('all', 'users', 'groups')
+SEGMENT_SINCE_FIELD = os.getenv('SEGMENT_SINCE_FIELD', '_id')
+SEGMENT_CACHE_SIZE = int(os.getenv('SEGMENT_CACHE_SIZE', '32'))
+
+# Audience snapshot - sorted int64 chat IDs ki file, mmap se padhi jati hai
+AUDIENCE_SNAPSHOT = os.getenv('AUDIENCE_SNAPSHOT', 'true').lower() == 'true'
+AUDIENCE_SNAPSHOT_FILE = os.getenv('AUDIENCE_SNAPSHOT_FILE', 'audience.snapshot')
+SNAPSHOT_REFRESH_INTERVAL = float(os.getenv('SNAPSHOT_REFRESH_INTERVAL', '30'))
+SNAPSHOT_REBUILD_INTERVAL = float(os.getenv('SNAPSHOT_REBUILD_INTERVAL', '86400'))
+SNAPSHOT_ID_SKEW = float(os.getenv('SNAPSHOT_ID_SKEW', '60'))
+# In-memory delta itna bada ho (ya itne seconds purana) toh background me file me merge
+SNAPSHOT_COMPACT_SIZE = int(os.getenv('SNAPSHOT_COMPACT_SIZE', '100000'))
+SNAPSHOT_COMPACT_INTERVAL = float(os.getenv('SNAPSHOT_COMPACT_INTERVAL', '600'))
+
+# Broadcast jobs ka progress itne seconds me Mongo me checkpoint hota hai
+CHECKPOINT_INTERVAL = float(os.getenv('CHECKPOINT_INTERVAL', '5'))
+
+# Delivery log - har job me har chat ka result, TTL ke baad expire
+DELIVERY_LOG = os.getenv('DELIVERY_LOG', 'false').lower() == 'true'
+DELIVERY_LOG_TTL_DAYS = float(os.getenv('DELIVERY_LOG_TTL_DAYS', '30'))
+DELIVERY_FLUSH_SIZE = int(os.getenv('DELIVERY_FLUSH_SIZE', '1000'))
+DELIVERY_FLUSH_INTERVAL = float(os.getenv('DELIVERY_FLUSH_INTERVAL', '2'))
+DELIVERY_BUFFER_LIMIT = int(os.getenv('DELIVERY_BUFFER_LIMIT', '200000'))
+
+# Queue me pade itne broadcasts tak ek audience pass me jaate hain
+BROADCAST_BATCH_MAX = int(os.getenv('BROADCAST_BATCH_MAX', '10'))
+
+# Status message kitne seconds me ek baar edit ho
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', '10'))
+
+# Session storage - 'file' (SQLite file) ya 'memory' (har restart par naya login)
+SESSION_STORAGE = os.getenv('SESSION_STORAGE', 'file')
+
+# Peer cache - broadcast se pehle bulk warm-up, session me batched write-back
+PEER_CACHE_SIZE = int(os.getenv('PEER_CACHE_SIZE', '200000'))
+PEER_WARM_BATCH = min(int(os.getenv('PEER_WARM_BATCH', '200')), 200)
+PEER_FLUSH_SIZE = int(os.getenv('PEER_FLUSH_SIZE', '1000'))
+PEER_FLUSH_INTERVAL = float(os.getenv('PEER_FLUSH_INTERVAL', '5'))
+
+# Metrics endpoint (Prometheus text format) - sirf local, 0 = band
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+# /profile - sampling profiler sirf command ke dauraan chalta hai
+PROFILE_DEFAULT_SECONDS = float(os.getenv('PROFILE_DEFAULT_SECONDS', '10'))
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '120'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+PROFILE_LAG_INTERVAL = float(os.getenv('PROFILE_LAG_INTERVAL', '0.05'))
+
+# send_to_chat results
+SEND_OK = 'sent'
+SEND_BLOCKED = 'blocked'
+SEND_FAILED = 'failed'
+SEND_RETRY = 'retry'
+
+# Ye errors temporary hain - chat ko retry queue me daalo
+TEMPORARY_ERRORS = (Flood, InternalServerError, asyncio.TimeoutError, OSError)
+
+# Structured logging - JSON lines file + console, background thread likhta hai
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'info').lower()
+LOG_FILE = os.getenv('LOG_FILE', 'broadcast.jsonl')
+LOG_CONSOLE = os.getenv('LOG_CONSOLE', 'true').lower() == 'true'
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '20000'))
+LOG_FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', '1'))
+LOG_SAMPLE_BURST = int(os.getenv('LOG_SAMPLE_BURST', '10'))
+LOG_SAMPLE_WINDOW = float(os.getenv('LOG_SAMPLE_WINDOW', '10'))
+LOG_LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+
+class EventLog:
+    """Non-blocking structured logger - records JSON lines me, likhna background thread ka kaam
+
+    Log call sirf level check karke ek deque me tuple daalta hai, event loop
+    par koi I/O nahi. Writer thread batches me file aur console par likhta
+    hai. Queue bhar jaye toh naye records drop hote hain (gin kar). `sample=True`
+    wale events (per-chat errors) har window me `burst` tak hi jaate hain,
+    baaki ka sirf count ek 'suppressed' record me.
+    """
+    def __init__(self, path, level, console=True, queue_size=20000, interval=1.0, burst=10, window=10.0):
+        self.path = path
+        self.level = LOG_LEVELS.get(level, LOG_LEVELS['info'])
+        self.console = console
+        self.queue_size = queue_size
+        self.interval = interval
+        self.burst = burst
+        self.window = window
+        self.records = deque()
+        self.samples = {}
+        self.dropped = 0
+        self.file = None
+        self.thread = None
+        self.wakeup = threading.Event()
+        self.write_lock = threading.Lock()
+
+    def debug(self, event, text='', sample=False, **fields):
+        self.emit('debug', event, text, sample, **fields)
+
+    def info(self, event, text='', sample=False, **fields):
+        self.emit('info', event, text, sample, **fields)
+
+    def warning(self, event, text='', sample=False, **fields):
+        self.emit('warning', event, text, sample, **fields)
+
+    def error(self, event, text='', sample=False, **fields):
+        self.emit('error', event, text, sample, **fields)
+
+    def emit(self, level, event, text='', sample=False, **fields):
+        if LOG_LEVELS[level] < self.level:
+            return
+        now = time.time()
+        if sample and not self.allow(event, now):
+            return
+        if len(self.records) >= self.queue_size:
+            self.dropped += 1
+            return
+        self.records.append((now, level, event, text, fields))
+        if self.thread is None:
+            self.start()
+        if LOG_LEVELS[level] >= LOG_LEVELS['error']:
+            self.wakeup.set()
+
+    def allow(self, event, now):
+        """Sampling - har window me event ke pehle `burst` records hi"""
+        window = self.samples.get(event)
+        if window is None or now - window[0] >= self.window:
+            self.summarize(event, now)
+            window = self.samples[event] = [now, 0, 0]
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+    def summarize(self, event, now):
+        window = self.samples.pop(event, None)
+        if window and window[2]:
+            self.records.append((
+                now, 'info', 'suppressed', f"🔇 {window[2]} '{event}' records suppressed",
+                {'for': event, 'count': window[2]}
+            ))
+
+    def start(self):
+        with self.write_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='event-log', daemon=True)
+                self.thread.start()
+                atexit.register(self.close)
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.write()
+
+    @staticmethod
+    def format(record):
+        ts, level, event, text, fields = record
+        doc = {'ts': round(ts, 3), 'level': level, 'event': event}
+        if text:
+            doc['msg'] = text
+        doc.update(fields)
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+    def write(self):
+        """Jama records ek batch me likho (writer thread me chalta hai)"""
+        with self.write_lock:
+            batch = []
+            while self.records:
+                batch.append(self.records.popleft())
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                batch.append((time.time(), 'warning', 'log_dropped', f"⚠️ {dropped} log records dropped", {'count': dropped}))
+            if not batch:
+                return
+            
+            try:
+                if self.path:
+                    if self.file is None:
+                        self.file = open(self.path, 'a', encoding='utf-8')
+                    self.file.write(''.join(self.format(record) + '\n' for record in batch))
+                    self.file.flush()
+                if self.console:
+                    sys.stdout.write(''.join((record[3] or self.format(record)) + '\n' for record in batch))
+                    sys.stdout.flush()
+            except Exception as e:
+                sys.stderr.write(f"log write failed: {e}\n")
+
+    def close(self):
+        """Exit par bache records aur suppressed counts likh do"""
+        now = time.time()
+        for event in list(self.samples):
+            self.summarize(event, now)
+        self.write()
+
+log = EventLog(
+    LOG_FILE,
+    LOG_LEVEL,
+    console=LOG_CONSOLE,
+    queue_size=LOG_QUEUE_SIZE,
+    interval=LOG_FLUSH_INTERVAL,
+    burst=LOG_SAMPLE_BURST,
+    window=LOG_SAMPLE_WINDOW
+)
+
 # Verify all credentials are loaded
 if not all([API_ID, API_HASH, BOT_TOKEN, MONGO_URL]):
-    print("❌ Error: .env file me saare credentials nahi hain!")
-    print("✅ Solution: .env file check karo aur saare variables add karo")
+    log.error('config_missing', "❌ Error: .env file me saare credentials nahi hain!")
+    log.info('config_hint', "✅ Solution: .env file check karo aur saare variables add karo")
     exit(1)
 
-app = Client("broadcast_bot", API_ID, API_HASH, bot_token=BOT_TOKEN)
+# Sirf current task ke Pyrogram calls ka sleep_threshold (None = client ka default)
+invoke_sleep_threshold = contextvars.ContextVar('invoke_sleep_threshold', default=None)
+
+class BotClient(Client):
+    """Client jiska sleep_threshold ek task ke andar badla ja sakta hai
+
+    Handlers, banall aur get_messages chhoti FloodWait par so kar chalte
+    rehte hain. Broadcast ka copy fallback `invoke_sleep_threshold` 0 karke
+    FloodWait seedha send_to_chat tak laata hai.
+    """
+    async def invoke(self, query, *args, sleep_threshold=None, **kwargs):
+        if sleep_threshold is None:
+            sleep_threshold = invoke_sleep_threshold.get()
+        return await super().invoke(query, *args, sleep_threshold=sleep_threshold, **kwargs)
+
+app = BotClient(
+    "broadcast_bot",
+    API_ID,
+    API_HASH,
+    bot_token=BOT_TOKEN,
+    in_memory=SESSION_STORAGE == 'memory'
+)
+
+class Counter:
+    """Prometheus counter - label values ke hisaab se alag series"""
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(label, '') for label in self.labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def total(self):
+        return sum(self.values.values())
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, dict(zip(self.labels, key)), value
+
+class Gauge:
+    """Scrape ke waqt function se value lo (queue depth, send rate etc.)"""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help = help_text
+        self.read = read
+
+    def samples(self):
+        yield self.name, {}, self.read()
+
+class Histogram:
+    """Latency histogram - fixed buckets, hot path par sirf ek bisect"""
+    kind = 'histogram'
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name, help_text, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(label, '') for label in self.labels)
+        series = self.series.get(key)
+        if series is None:
+            # [bucket counts..., +Inf], sum
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def merged(self):
+        """Saari label series ek saath - (bucket counts, sum, count)"""
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for bucket_counts, value_sum in self.series.values():
+            counts = [a + b for a, b in zip(counts, bucket_counts)]
+            total += value_sum
+        return counts, total, sum(counts)
+
+    def quantile(self, q, counts=None):
+        """Buckets se quantile ka andaza (bucket ke andar linear)"""
+        if counts is None:
+            counts = self.merged()[0]
+        count = sum(counts)
+        if not count:
+            return 0.0
+        
+        rank = q * count
+        seen = 0
+        for i, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def samples(self):
+        for key, (bucket_counts, value_sum) in self.series.items():
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), bucket_counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", dict(labels, le=str(bound)), cumulative
+            yield f"{self.name}_sum", labels, value_sum
+            yield f"{self.name}_count", labels, cumulative
+
+class MetricsRegistry:
+    """Saare metrics - Prometheus text format me render"""
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, labels, value in metric.samples():
+                    if labels:
+                        label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                        lines.append(f"{name}{{{label_text}}} {value}")
+                    else:
+                        lines.append(f"{name} {value}")
+            except Exception as e:
+                log.error('metric_render_failed', f"Error rendering metric {metric.name}: {e}", metric=metric.name)
+        return '\n'.join(lines) + '\n'
+
+    async def handle(self, reader, writer):
+        """Ek HTTP request - GET /metrics ka jawab, baaki 404"""
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # Headers padh ke chhod do
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 5)
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+            
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.render().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        """Local metrics endpoint shuru karo"""
+        server = await asyncio.start_server(self.handle, host, port)
+        log.info('metrics_serving', f"📈 Metrics endpoint: http://{host}:{port}/metrics", host=host, port=port)
+        return server
+
+# Hot path instrumentation - /metrics aur /perf dono yahin se padhte hain
+metrics = MetricsRegistry()
+SEND_SECONDS = metrics.register(Histogram(
+    'broadcast_send_seconds', 'Ek chat ko send ka time (Telegram request)', labels=('result',)
+))
+SEND_ERRORS = metrics.register(Counter(
+    'broadcast_send_errors_total', 'Send errors error class ke hisaab se', labels=('error',)
+))
+FLOOD_WAIT_SECONDS = metrics.register(Counter(
+    'broadcast_flood_wait_seconds_total', 'FloodWait me Telegram ka manga gaya total wait'
+))
+LIMITER_WAIT_SECONDS = metrics.register(Histogram(
+    'broadcast_limiter_wait_seconds', 'Rate limiter (aur FloodWait gate) par wait'
+))
+SCAN_WAIT_SECONDS = metrics.register(Histogram(
+    'broadcast_scan_wait_seconds', 'Audience merge ka agle Mongo batch par wait', labels=('collection',)
+))
+DB_OP_SECONDS = metrics.register(Histogram(
+    'db_op_seconds', 'Thread pool me chali DB calls ka time', labels=('op',)
+))
+
+class LoopProfiler:
+    """On-demand sampling profiler - sirf /profile ke dauraan kuch chalta hai
+
+    Ek thread har `interval` par event loop thread ka Python stack padhta hai
+    (sys._current_frames) aur folded stacks ginta hai - flamegraph.pl aur
+    speedscope ye format seedha padhte hain. Saath me loop lag (sleep ka
+    overshoot) aur har callback ka time (Handle._run wrap karke) record
+    hota hai. Profile khatam hote hi wrap hat jata hai.
+    """
+    IDLE_FRAMES = ('select (selectors.py', 'poll (selectors.py', 'control (selectors.py')
+
+    def __init__(self, interval, lag_interval):
+        self.interval = interval
+        self.lag_interval = lag_interval
+        self.lock = asyncio.Lock()
+
+    @property
+    def running(self):
+        return self.lock.locked()
+
+    @staticmethod
+    def frame_name(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def sample(self, thread_id, stacks, stop):
+        """Loop thread ka stack har interval par (profiler thread me chalta hai)"""
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            names = []
+            while frame is not None:
+                names.append(self.frame_name(frame))
+                frame = frame.f_back
+            key = ';'.join(reversed(names))
+            stacks[key] = stacks.get(key, 0) + 1
+
+    @staticmethod
+    def callback_name(handle):
+        """Callback ka naam - task step ho toh uska coroutine"""
+        callback = handle._callback
+        owner = getattr(callback, '__self__', None)
+        if isinstance(owner, asyncio.Task):
+            return owner.get_coro().__qualname__
+        return getattr(callback, '__qualname__', type(callback).__name__)
+
+    async def run(self, seconds):
+        """`seconds` tak profile karo - stacks, loop lag aur callback timings lautao"""
+        async with self.lock:
+            stacks = {}
+            callbacks = {}
+            lags = []
+            stop = threading.Event()
+            sampler = threading.Thread(
+                target=self.sample, args=(threading.get_ident(), stacks, stop), name='profiler', daemon=True
+            )
+            
+            original = asyncio.events.Handle._run
+            def timed_run(handle):
+                started = time.perf_counter()
+                try:
+                    return original(handle)
+                finally:
+                    elapsed = time.perf_counter() - started
+                    stat = callbacks.setdefault(self.callback_name(handle), [0, 0.0, 0.0])
+                    stat[0] += 1
+                    stat[1] += elapsed
+                    stat[2] = max(stat[2], elapsed)
+            
+            asyncio.events.Handle._run = timed_run
+            sampler.start()
+            started = time.perf_counter()
+            try:
+                while time.perf_counter() - started < seconds:
+                    before = time.perf_counter()
+                    await asyncio.sleep(self.lag_interval)
+                    lags.append(max(0.0, time.perf_counter() - before - self.lag_interval))
+            finally:
+                asyncio.events.Handle._run = original
+                stop.set()
+                await asyncio.get_running_loop().run_in_executor(None, sampler.join)
+            
+            return {
+                'seconds': time.perf_counter() - started,
+                'stacks': stacks,
+                'callbacks': callbacks,
+                'lags': sorted(lags)
+            }
+
+    @classmethod
+    def is_idle(cls, stack):
+        leaf = stack.rsplit(';', 1)[-1]
+        return leaf.startswith(cls.IDLE_FRAMES)
+
+    @staticmethod
+    def write_folded(path, stacks):
+        """Folded stacks file - `stack count` har line (executor me chalta hai)"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(stacks.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+
+def percentile(values, q):
+    """Sorted list ka percentile"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+profiler = LoopProfiler(PROFILE_INTERVAL, PROFILE_LAG_INTERVAL)
+
+class BackoffGate:
+    """FloodWait aane par sabhi senders ko ek saath rok do"""
+    def __init__(self):
+        self.opened = asyncio.Event()
+        self.opened.set()
+        self.until = 0.0
+        self.timer = None
+
+    def trip(self, seconds):
+        """Gate ko `seconds` ke liye band karo (pehle se lamba wait ho toh kuch mat karo)"""
+        until = time.monotonic() + seconds
+        if until <= self.until:
+            return
+        
+        self.until = until
+        self.opened.clear()
+        if self.timer:
+            self.timer.cancel()
+        self.timer = asyncio.get_running_loop().call_later(seconds, self.opened.set)
+
+    @property
+    def is_open(self):
+        return self.opened.is_set()
+
+    async def wait(self):
+        await self.opened.wait()
+
+class RetryQueue:
+    """Temporary failures ke liye exponential backoff retry queue"""
+    def __init__(self, base_delay, max_delay, max_attempts):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.heap = []
+        self.seq = 0
+        self.wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, chat_id, attempt, min_delay=0, index=0):
+        """Chat ko retry ke liye schedule karo (message `index` se) - attempts khatam ho gaye toh False"""
+        if attempt >= self.max_attempts:
+            return False
+        
+        delay = max(min_delay, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        heapq.heappush(self.heap, (time.monotonic() + delay, self.seq, chat_id, attempt + 1, index))
+        self.seq += 1
+        self.wakeup.set()
+        return True
+
+    async def feed(self, queue):
+        """Jinka time aa gaya unhe work queue me wapas daalo"""
+        while True:
+            if not self.heap:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            
+            delay = self.heap[0][0] - time.monotonic()
+            if delay > 0:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            _, _, chat_id, attempt, index = heapq.heappop(self.heap)
+            await queue.put((chat_id, attempt, index))
+
+class RateLimiter:
+    """Token bucket - global rate limit + per-chat spacing"""
+    def __init__(self, rate, burst=1, chat_interval=1.0, group_interval=3.0, gate=None):
+        self.gate = gate or BackoffGate()
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+        
+        # Per-chat spacing: groups (negative IDs) ko zyada gap chahiye
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.last_sent = {}
+        self.acquired = 0
+
+    def chat_spacing(self, chat_id):
+        return self.group_interval if chat_id < 0 else self.chat_interval
+
+    async def acquire(self, chat_id):
+        """Send slot milne tak wait karo"""
+        # Same chat me lagatar messages ke beech gap rakho
+        last = self.last_sent.get(chat_id)
+        if last is not None:
+            wait = last + self.chat_spacing(chat_id) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        
+        # Global token bucket - lock FIFO order me slots deta hai
+        async with self.lock:
+            while True:
+                # FloodWait chal raha hai toh sab yahin rukenge
+                await self.gate.wait()
+                
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+        
+        now = time.monotonic()
+        self.last_sent[chat_id] = now
+        self.acquired += 1
+        
+        # Purane per-chat entries hatao taaki dict bounded rahe
+        if self.acquired % 1000 == 0:
+            horizon = now - max(self.chat_interval, self.group_interval)
+            self.last_sent = {cid: t for cid, t in self.last_sent.items() if t > horizon}
+
+class RateController:
+    """AIMD controller - limiter ka rate Telegram ke response ke hisaab se
+
+    Har RATE_INCREASE_INTERVAL bina FloodWait ke poore rate par chale toh
+    rate `step` se badhta hai (ceiling tak). FloodWait par rate `factor` se
+    kat jaata hai - wait khatam hone tak aaye baaki FloodWaits (jo usi burst
+    ke in-flight sends hain) dobara nahi katte. Seekha hua rate agle jobs
+    me bhi chalta rehta hai.
+    """
+    def __init__(self, limiter: RateLimiter, floor, ceiling, step, interval, factor):
+        self.limiter = limiter
+        self.floor = min(floor, ceiling)
+        self.ceiling = ceiling
+        self.step = step
+        self.interval = interval
+        self.factor = factor
+        self.limiter.rate = max(self.floor, min(limiter.rate, ceiling))
+        self.window_start = time.monotonic()
+        self.window_sent = 0
+        self.hold_until = 0.0
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def rate(self):
+        return self.limiter.rate
+
+    def on_success(self):
+        """Successful send - window poora aur rate ke paas chal rahe the toh badhao"""
+        self.window_sent += 1
+        now = time.monotonic()
+        elapsed = now - self.window_start
+        if elapsed < self.interval:
+            return
+        
+        # Idle/slow periods (audience khatam, pause) ko clean signal mat maano
+        if now >= self.hold_until and self.window_sent >= self.rate * elapsed * 0.8:
+            new_rate = min(self.ceiling, self.rate + self.step)
+            if new_rate > self.rate:
+                self.limiter.rate = new_rate
+                self.increases += 1
+        self.window_start = now
+        self.window_sent = 0
+
+    def on_flood(self, seconds):
+        """FloodWait - rate multiplicatively ghatao, ek burst par ek hi baar"""
+        now = time.monotonic()
+        if now < self.hold_until:
+            return
+        
+        self.limiter.rate = max(self.floor, self.rate * self.factor)
+        self.decreases += 1
+        self.hold_until = now + max(seconds, self.interval)
+        self.window_start = self.hold_until
+        self.window_sent = 0
+        log.warning('rate_reduced', f"🐢 Send rate reduced to {self.rate:.1f} msg/s", rate=round(self.rate, 2), flood_wait=seconds)
+
+class AsyncDB:
+    """Blocking pymongo / file I/O ko dedicated thread pool me chalao"""
+    def __init__(self, threads, timeout):
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='db')
+        self.timeout = timeout
+
+    async def run(self, func, *args, timeout=None, **kwargs):
+        """func ko pool me chalao - event loop block nahi hoga"""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self.executor, call),
+                timeout or self.timeout
+            )
+        finally:
+            DB_OP_SECONDS.observe(time.perf_counter() - started, op=getattr(func, '__name__', 'call'))
+
+class Readiness:
+    """Startup phases ki state aur timing - /ready aur startup log isi se
+
+    `core` phases (Mongo, indexes, failed chats) ke khatam hote hi (pass ya
+    fail) `settled` set hota hai - broadcasts tabhi shuru hote hain. `warm`
+    phases (jobs resume, snapshot) readiness ko nahi rokte.
+    """
+    def __init__(self, core, warm):
+        self.core = core
+        self.phases = {
+            name: {'state': 'pending', 'seconds': None, 'error': None}
+            for name in ('setup', 'telegram') + core + warm
+        }
+        self.settled = asyncio.Event()
+        # start_services ka background task - reference yahin, shutdown par cancel
+        self.task = None
+
+    def record(self, name, seconds, error=None):
+        phase = self.phases[name]
+        phase.update(state='failed' if error else 'ok', seconds=seconds, error=error)
+        if error:
+            log.error('startup_phase_failed', f"❌ Startup phase {name} failed: {error}", phase=name, seconds=round(seconds, 3))
+        else:
+            log.info('startup_phase', f"✅ Startup phase {name}: {seconds * 1000:.0f} ms", phase=name, seconds=round(seconds, 3))
+
+    async def run(self, name, func, *args):
+        """Phase chalao aur time record karo - error phase ko failed karta hai, startup ko nahi"""
+        self.phases[name]['state'] = 'running'
+        started = time.perf_counter()
+        try:
+            result = await func(*args)
+        except Exception as e:
+            self.record(name, time.perf_counter() - started, str(e) or type(e).__name__)
+            return None
+        self.record(name, time.perf_counter() - started)
+        return result
+
+    @property
+    def ready(self):
+        return self.settled.is_set() and all(self.phases[name]['state'] == 'ok' for name in self.core)
+
+    def failed(self):
+        return [name for name, phase in self.phases.items() if phase['state'] == 'failed']
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - BOOT_STARTED
+
+class HyperLogLog:
+    """Approximate distinct counter - fixed 16KB memory, ~1% error"""
+    MASK = (1 << 64) - 1
+
+    def __init__(self, p=14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, value):
+        # splitmix64 - chat IDs ko achhe se spread karo
+        x = (value * 0x9E3779B97F4A7C15) & self.MASK
+        x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & self.MASK
+        x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & self.MASK
+        x ^= x >> 31
+        
+        index = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        
+        # Chhote sets ke liye linear counting zyada sahi hai
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(estimate)
+
+class StatsCache:
+    """Stats ka TTL cache - stale hone par background me refresh hota hai"""
+    def __init__(self, ttl, loader):
+        self.ttl = ttl
+        self.loader = loader
+        self.values = None
+        self.updated = 0.0
+        self.task = None
+
+    @property
+    def age(self):
+        return time.monotonic() - self.updated
+
+    async def get(self):
+        """Cached values do - pehli baar hi loader ka wait hota hai"""
+        if self.values is None or self.age > self.ttl:
+            task = self.schedule_refresh()
+            if self.values is None:
+                await asyncio.shield(task)
+        return self.values
+
+    def schedule_refresh(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.refresh())
+        return self.task
+
+    async def refresh(self):
+        values = await self.loader()
+        if values is not None:
+            self.values = values
+            self.updated = time.monotonic()
+
+    def update(self, **values):
+        """Broadcast ke exact numbers se cache update karo"""
+        if self.values is not None:
+            self.values.update(values)
+
+    def adjust(self, key, delta):
+        if self.values is not None:
+            self.values[key] = max(0, self.values.get(key, 0) + delta)
+
+class FailureStore:
+    """Failed chats ke counters - Mongo me batched upserts, memory me int-keyed index
+
+    Har change `pending` me jama hota hai aur bulk_write se flush hota hai,
+    isliye save ka cost sirf changes jitna hai. Index startup ke core phase
+    (`load_failed_chats`) me background me load hota hai - broadcasts uske
+    settle hone tak rukte hain.
+
+    Dead chats (blocked, ya threshold tak fail) source collections me
+    `inactive` flag ho jaate hain, taaki audience query unhe khud skip kare.
+    """
+    BACKFILL_MARKER = 'failed_chats_backfill'
+
+    def __init__(self, collection, db, threshold, sources=(), markers=None):
+        self.collection = collection
+        self.markers = markers
+        self.db = db
+        self.threshold = threshold
+        self.sources = sources
+        self.counts = {}
+        self.pending = {}
+        self.dead = set()
+        self.loaded = False
+        self.load_lock = asyncio.Lock()
+        self.flush_task = None
+        self.flush_now = asyncio.Event()
+        self.last_flush = time.monotonic()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def read_counts(self):
+        """Mongo se saare counters padho (thread me chalta hai)"""
+        cursor = self.collection.find({}, {'count': 1}, batch_size=AUDIENCE_BATCH_SIZE)
+        with cursor:
+            return {doc['_id']: doc['count'] for doc in cursor}
+
+    def migrate_json(self):
+        """Purani failed_chats.json ek baar Mongo me import karo (thread me chalta hai)"""
+        if not os.path.exists(FAILED_CHATS_FILE):
+            return 0
+        
+        with open(FAILED_CHATS_FILE, 'r') as f:
+            old = json.load(f)
+        
+        ops = [
+            UpdateOne({'_id': int(chat_id)}, {'$max': {'count': count}}, upsert=True)
+            for chat_id, count in old.items()
+        ]
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+        os.replace(FAILED_CHATS_FILE, FAILED_CHATS_FILE + '.migrated')
+        return len(ops)
+
+    async def load(self):
+        """In-memory index ek baar load karo"""
+        if self.loaded:
+            return
+        
+        async with self.load_lock:
+            if self.loaded:
+                return
+            try:
+                migrated = await self.db.run(self.migrate_json)
+                if migrated:
+                    log.info('failed_chats_migrated', f"✅ {migrated} failed chats migrated from {FAILED_CHATS_FILE}", count=migrated)
+                
+                counts = await self.db.run(self.read_counts, timeout=DB_SCAN_TIMEOUT)
+            except Exception as e:
+                log.error('failed_chats_load_failed', f"Error loading failed chats: {e}")
+                return
+            
+            # Load ke dauraan aaye changes upar se apply karo
+            for chat_id, (reset, inc) in self.pending.items():
+                if reset:
+                    counts.pop(chat_id, None)
+                if inc:
+                    counts[chat_id] = counts.get(chat_id, 0) + inc
+            self.counts = counts
+            self.loaded = True
+            
+            # Pehle se threshold par pahunche chats (failed_chats.json ya purane counters)
+            # bhi source par flag hon - sirf ek baar, marker ke saath
+            over = [chat_id for chat_id, count in counts.items() if count >= self.threshold]
+            if over and self.markers is not None:
+                try:
+                    marked = await self.db.run(self.backfill, over, datetime.utcnow(), timeout=DB_SCAN_TIMEOUT)
+                    if marked:
+                        log.info('dead_chats_backfilled', f"✅ {marked} dead chats flagged inactive", count=marked)
+                except Exception as e:
+                    log.error('dead_chats_mark_failed', f"Error marking dead chats: {e}", count=len(over))
+                    self.dead.update(over)
+
+    def record_failure(self, chat_id, dead=False):
+        """Failure count badhao - dead=True (blocked) ya threshold par source me flag"""
+        count = self.counts.get(chat_id, 0) + 1
+        self.counts[chat_id] = count
+        reset, inc = self.pending.get(chat_id, (False, 0))
+        self.pending[chat_id] = (reset, inc + 1)
+        
+        if dead or count >= self.threshold:
+            self.dead.add(chat_id)
+        self.maybe_flush()
+
+    def record_success(self, chat_id):
+        """Success par counter reset - sirf un chats ke liye jo pehle fail hue the"""
+        if chat_id in self.counts:
+            del self.counts[chat_id]
+            self.pending[chat_id] = (True, 0)
+            self.maybe_flush()
+
+    def maybe_flush(self):
+        """Background flush schedule karo - batch bharte hi turant"""
+        if len(self.pending) >= FAILURE_FLUSH_SIZE:
+            self.flush_now.set()
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        """Batch bharne ya flush interval nikalne tak ruko, phir flush"""
+        delay = FAILURE_FLUSH_INTERVAL - (time.monotonic() - self.last_flush)
+        if delay > 0 and not self.flush_now.is_set():
+            try:
+                await asyncio.wait_for(self.flush_now.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        self.flush_now.clear()
+        await self.flush()
+
+    def mark_inactive(self, chat_ids, when):
+        """Source documents par inactive flag lagao - chhote batches me (thread me chalta hai)"""
+        for i in range(0, len(chat_ids), FAILURE_MARK_BATCH):
+            batch = chat_ids[i:i + FAILURE_MARK_BATCH]
+            for collection, field in self.sources:
+                collection.update_many(
+                    {field: {'$in': batch}, **ACTIVE_FILTER},
+                    {'$set': {'inactive': True, 'blocked_at': when}}
+                )
+
+    def backfill(self, over, when):
+        """Threshold par pahunche purane chats ek baar flag karo (thread me chalta hai)
+
+        Marker bot DB me rehta hai, toh restart par poori list ki query
+        dobara nahi hoti. Threshold kam hua ho toh backfill phir chalta hai.
+        """
+        marker = self.markers.find_one({'_id': self.BACKFILL_MARKER})
+        if marker and marker.get('threshold', math.inf) <= self.threshold:
+            return 0
+        self.mark_inactive(over, when)
+        self.markers.update_one(
+            {'_id': self.BACKFILL_MARKER},
+            {'$set': {'threshold': self.threshold, 'done_at': when}},
+            upsert=True
+        )
+        return len(over)
+
+    async def flush(self):
+        """Pending changes ek bulk_write me Mongo me likho"""
+        self.last_flush = time.monotonic()
+        
+        if self.dead:
+            dead, self.dead = self.dead, set()
+            try:
+                await self.db.run(self.mark_inactive, list(dead), datetime.utcnow())
+            except Exception as e:
+                log.error('dead_chats_mark_failed', f"Error marking dead chats: {e}", count=len(dead))
+                self.dead |= dead
+        
+        if not self.pending:
+            return
+        
+        batch, self.pending = self.pending, {}
+        ops = []
+        now = datetime.utcnow()
+        for chat_id, (reset, inc) in batch.items():
+            if reset:
+                ops.append(DeleteOne({'_id': chat_id}))
+            if inc:
+                ops.append(UpdateOne(
+                    {'_id': chat_id},
+                    {'$inc': {'count': inc}, '$set': {'updated_at': now}},
+                    upsert=True
+                ))
+        
+        try:
+            await self.db.run(self.collection.bulk_write, ops, ordered=True)
+        except Exception as e:
+            log.error('failed_chats_save_failed', f"Error saving failed chats: {e}", count=len(batch))
+            
+            # Batch wapas pending me daalo - naye changes upar rahenge
+            for chat_id, (reset, inc) in batch.items():
+                if chat_id not in self.pending:
+                    self.pending[chat_id] = (reset, inc)
+                else:
+                    new_reset, new_inc = self.pending[chat_id]
+                    if not new_reset:
+                        self.pending[chat_id] = (reset, inc + new_inc)
+
+    async def close(self):
+        """Chal raha flush khatam karo aur baaki sab likh do"""
+        if self.flush_task and not self.flush_task.done():
+            self.flush_now.set()
+            await self.flush_task
+        await self.flush()
+
+    def reactivate_all(self):
+        """Sabhi source documents se inactive flag hatao (thread me chalta hai)"""
+        for collection, _ in self.sources:
+            collection.update_many(
+                {'inactive': True},
+                {'$unset': {'inactive': '', 'blocked_at': ''}}
+            )
+
+    async def clear(self):
+        """Saare failed chats hatao - dead chats ko bhi dobara mauka do"""
+        await self.close()
+        self.pending = {}
+        self.dead = set()
+        await self.db.run(self.collection.delete_many, {})
+        await self.db.run(self.reactivate_all, timeout=DB_SCAN_TIMEOUT)
+        count = len(self.counts)
+        self.counts = {}
+        return count
+
+def parse_segment(args):
+    """Command args se segment - `users` / `groups` aur `since=2024-01-31` ya `since=30d`"""
+    segment = {'kind': 'all', 'since': None}
+    for arg in args:
+        arg = arg.lower()
+        if arg in SEGMENT_KINDS:
+            segment['kind'] = arg
+        elif arg.startswith('since='):
+            value = arg[len('since='):]
+            if value[:-1].isdigit() and value.endswith('d'):
+                since = datetime.utcnow() - timedelta(days=int(value[:-1]))
+            else:
+                since = datetime.strptime(value, '%Y-%m-%d')
+            # Din ki shuruaat tak - cache key same rahe
+            segment['since'] = since.replace(hour=0, minute=0, second=0, microsecond=0)
+        else:
+            raise ValueError(f"unknown segment option: {arg}")
+    return segment
+
+def job_segment(job):
+    """Job ka segment (purane jobs poori audience ke the)"""
+    return job.get('segment') or {'kind': 'all', 'since': None}
+
+def segment_key(segment):
+    since = segment.get('since')
+    return f"{segment['kind']}:{since:%Y-%m-%d}" if since else segment['kind']
+
+def segment_label(segment):
+    labels = {'all': "📢 Sabhi chats", 'users': "👤 Sirf users", 'groups': "👥 Sirf groups"}
+    since = segment.get('since')
+    return labels[segment['kind']] + (f" (since {since:%Y-%m-%d})" if since else "")
+
+def batch_key(job):
+    """Kaunse queued jobs ek audience pass me ja sakte hain - same segment wale.
+    Checkpoint se chalne wala (missed resend) job akela jata hai."""
+    checkpoint = job.get('checkpoint') or {}
+    if checkpoint.get('after') is not None or checkpoint.get('retry'):
+        return job['_id']
+    return segment_key(job_segment(job))
+
+def job_sources(job):
+    """Job ke source messages (purane jobs me ek hi 'source' hota tha)"""
+    return job.get('sources') or [job['source']]
+
+class JobStore:
+    """Broadcast jobs Mongo me - crash/restart ke baad resume ke liye"""
+    def __init__(self, collection, db):
+        self.collection = collection
+        self.db = db
+
+    async def create(self, messages, status_msg: Message, audience=None, checkpoint=None, status='running', segment=None):
+        """Naya job banao - source messages ka reference save hota hai
+
+        `audience` diya ho toh job poori audience ki jagah kisi purane job ke
+        delivery log ka subset bhejta hai ({'job_id': ..., 'statuses': [...]}).
+        `segment` audience ko users/groups/since tak seemit karta hai.
+        """
+        now = datetime.utcnow()
+        job = {
+            '_id': uuid.uuid4().hex[:8],
+            'status': status,
+            'sources': [{'chat_id': message.chat.id, 'message_id': message.id} for message in messages],
+            'status_message': {'chat_id': status_msg.chat.id, 'message_id': status_msg.id},
+            'checkpoint': checkpoint or {'after': None, 'retry': []},
+            'counters': {'done': 0, 'success': 0, 'failed': 0},
+            'created_at': now,
+            'updated_at': now
+        }
+        if audience:
+            job['audience'] = audience
+        if segment:
+            job['segment'] = segment
+        await self.db.run(self.collection.insert_one, job)
+        return job
+
+    async def checkpoint(self, job_id, checkpoint, counters):
+        await self.db.run(
+            self.collection.update_one,
+            {'_id': job_id},
+            {'$set': {'checkpoint': checkpoint, 'counters': counters, 'updated_at': datetime.utcnow()}}
+        )
+
+    async def finish(self, job_id, status, counters):
+        await self.db.run(
+            self.collection.update_one,
+            {'_id': job_id},
+            {'$set': {'status': status, 'counters': counters, 'updated_at': datetime.utcnow()}}
+        )
+
+    async def unfinished(self):
+        """Jo jobs crash/restart ki wajah se adhoore reh gaye"""
+        cursor = self.collection.find({'status': 'running'}).sort('created_at', 1)
+        return await self.db.run(list, cursor)
+
+    async def get(self, job_id):
+        return await self.db.run(self.collection.find_one, {'_id': job_id})
+
+    async def count_queued(self):
+        return await self.db.run(self.collection.count_documents, {'status': 'queued'})
+
+    async def cancel_queued(self, job_id):
+        result = await self.db.run(
+            self.collection.update_one,
+            {'_id': job_id, 'status': 'queued'},
+            {'$set': {'status': 'cancelled', 'updated_at': datetime.utcnow()}}
+        )
+        return result.modified_count > 0
+
+    async def queued(self, limit):
+        """Queue me pade jobs - sabse purana pehle"""
+        cursor = self.collection.find({'status': 'queued'}).sort('created_at', 1).limit(limit)
+        return await self.db.run(list, cursor)
+
+    async def merge(self, leader_id, merged_ids, sources):
+        """Queued jobs ek job me - leader saare messages bhejega, baaki 'merged'"""
+        now = datetime.utcnow()
+        await self.db.run(
+            self.collection.update_one,
+            {'_id': leader_id},
+            {'$set': {'status': 'running', 'sources': sources, 'updated_at': now}}
+        )
+        if merged_ids:
+            await self.db.run(
+                self.collection.update_many,
+                {'_id': {'$in': merged_ids}},
+                {'$set': {'status': 'merged', 'merged_into': leader_id, 'updated_at': now}}
+            )
+
+    async def recent(self, limit=5):
+        cursor = self.collection.find({}, {'checkpoint': 0}).sort('created_at', -1).limit(limit)
+        return await self.db.run(list, cursor)
+
+class DeliveryLog:
+    """Har job me har chat ka result (message ID ke saath) - optional
+
+    Records `buffer` me jama hote hain aur insert_many se batch me likhe
+    jaate hain. TTL index purane records khud expire karta hai, aur
+    (job_id, status, chat_id) index se failed subset sorted order me nikal
+    aata hai - resend usi se chalta hai, poori audience par nahi.
+    """
+    def __init__(self, collection, db, enabled, ttl_days):
+        self.collection = collection
+        self.db = db
+        self.enabled = enabled
+        self.ttl = int(ttl_days * 86400)
+        self.buffer = []
+        self.flush_task = None
+        self.flush_now = asyncio.Event()
+        self.last_flush = time.monotonic()
+
+    @staticmethod
+    def index():
+        return [('job_id', 1), ('status', 1), ('chat_id', 1)]
+
+    def ensure_indexes(self):
+        """Resend query ka index aur TTL index (sync, startup par)"""
+        if not self.enabled:
+            return
+        try:
+            self.collection.create_index(self.index(), background=True)
+            try:
+                self.collection.create_index('at', expireAfterSeconds=self.ttl, background=True)
+            except Exception:
+                # TTL badla hai - index dobara banane ki jagah expiry update karo
+                self.collection.database.command(
+                    'collMod', self.collection.name,
+                    index={'keyPattern': {'at': 1}, 'expireAfterSeconds': self.ttl}
+                )
+        except Exception as e:
+            log.error('delivery_index_failed', f"Error ensuring delivery log indexes: {e}")
+
+    def record(self, job_id, chat_id, status, message_ids=()):
+        """Chat ka final result - har source message ka Telegram message ID (na gaya ho toh None)"""
+        if not self.enabled:
+            return
+        self.buffer.append({
+            'job_id': job_id,
+            'chat_id': chat_id,
+            'status': status,
+            'message_ids': list(message_ids),
+            'at': datetime.utcnow()
+        })
+        if len(self.buffer) >= DELIVERY_FLUSH_SIZE:
+            self.flush_now.set()
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        delay = DELIVERY_FLUSH_INTERVAL - (time.monotonic() - self.last_flush)
+        if delay > 0 and not self.flush_now.is_set():
+            try:
+                await asyncio.wait_for(self.flush_now.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        self.flush_now.clear()
+        await self.flush()
+
+    async def flush(self):
+        """Buffer ek insert_many me likho"""
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return
+        
+        batch, self.buffer = self.buffer, []
+        try:
+            await self.db.run(self.collection.insert_many, batch, ordered=False)
+        except Exception as e:
+            log.error('delivery_save_failed', f"Error saving delivery log: {e}")
+            # Mongo down ho toh memory bounded rakho - sabse purane records chhod do
+            self.buffer = (batch + self.buffer)[-DELIVERY_BUFFER_LIMIT:]
+
+    async def close(self):
+        if self.flush_task and not self.flush_task.done():
+            self.flush_now.set()
+            await self.flush_task
+        await self.flush()
+
+    async def count(self, job_id, statuses):
+        return await self.db.run(
+            self.collection.count_documents,
+            {'job_id': job_id, 'status': {'$in': statuses}},
+            hint=self.index()
+        )
+
+    async def iter_chats(self, job_id, statuses, after=None):
+        """Job ke diye gaye status wale chats - chat ID order me, `after` ke baad se"""
+        query = {'job_id': job_id, 'status': {'$in': statuses}}
+        if after is not None:
+            query['chat_id'] = {'$gt': after}
+        cursor = self.collection.find(
+            query,
+            {'_id': 0, 'chat_id': 1},
+            batch_size=AUDIENCE_BATCH_SIZE
+        ).sort('chat_id', 1).hint(self.index())
+        
+        last = None
+        try:
+            while True:
+                docs = await self.db.run(fetch_batch, cursor, AUDIENCE_BATCH_SIZE)
+                if not docs:
+                    break
+                for doc in docs:
+                    # Resume ke baad same chat ke do records ho sakte hain
+                    if doc['chat_id'] != last:
+                        last = doc['chat_id']
+                        yield last
+        finally:
+            await self.db.run(cursor.close)
+
+class ProgressTracker:
+    """Delivered range ka low watermark - isse neeche ke sabhi chats ho chuke
+
+    Audience sorted order me aati hai, isliye ek chat ID hi poori position
+    batati hai. Retry queue me pade chats alag list me checkpoint hote hain,
+    saath me agla message index (multi-message jobs ke liye).
+    """
+    def __init__(self, after=None):
+        self.watermark = after
+        self.order = deque()
+        self.finished = set()
+        self.retrying = {}
+
+    def dispatched(self, chat_id):
+        self.order.append(chat_id)
+
+    def completed(self, chat_id):
+        """Pehla attempt khatam (sent / failed / retry queue me gaya)"""
+        self.finished.add(chat_id)
+        while self.order and self.order[0] in self.finished:
+            self.watermark = self.order.popleft()
+            self.finished.discard(self.watermark)
+
+    def checkpoint(self):
+        return {'after': self.watermark, 'retry': [[chat_id, index] for chat_id, index in self.retrying.items()]}
+
+class JobScheduler:
+    """Broadcast jobs ko tracked background tasks me chalao - pause/resume/cancel ke saath
+
+    Poori audience wala broadcast ek waqt me ek hi chalta hai. Uske chalte
+    aaye broadcasts Mongo me 'queued' rehte hain, aur agla run saare queued
+    messages ek hi audience pass me bhejta hai - har chat ko order me.
+    """
+    def __init__(self, system):
+        self.system = system
+        self.active = {}
+        self.pending = {}
+        self.dispatch_lock = asyncio.Lock()
+
+    async def submit(self, messages, status_msg: Message, segment=None, **options):
+        """Naya job banao aur turant job ID lautao - broadcast queue se hokar chalta hai"""
+        if options.get('audience'):
+            # Delivery log ke subset wale resend queue me nahi rukte - poori audience pass nahi hain
+            job = await self.system.jobs.create(messages, status_msg, segment=segment, **options)
+            self.start(messages, status_msg, job)
+            return job['_id']
+        
+        # Poori audience wale jobs (missed resend bhi) ek waqt me ek - queue se
+        job = await self.system.jobs.create(messages, status_msg, status='queued', segment=segment, **options)
+        self.pending[job['_id']] = (messages, status_msg)
+        await self.dispatch()
+        
+        if job['_id'] in self.pending:
+            position = await self.system.jobs.count_queued()
+            try:
+                await status_msg.edit(
+                    f"📥 **Broadcast queue me hai!** (position {position})\n\n"
+                    f"🆔 Job: `{job['_id']}`\n"
+                    f"Chal raha broadcast khatam hote hi saare queued messages ek saath jayenge."
+                )
+            except Exception:
+                pass
+        return job['_id']
+
+    def broadcasting(self):
+        """Poori audience wala job chal raha hai?"""
+        return any(run['full'] for run in self.active.values())
+
+    async def dispatch(self):
+        """Koi broadcast nahi chal raha toh queued jobs ek batch job me shuru karo"""
+        async with self.dispatch_lock:
+            while not self.broadcasting():
+                queued = await self.system.jobs.queued(BROADCAST_BATCH_MAX)
+                if not queued:
+                    return
+                
+                # Ek pass me ek hi segment - baaki jobs agle pass tak queue me
+                key = batch_key(queued[0])
+                batch = []
+                for job in queued:
+                    if batch_key(job) != key:
+                        continue
+                    loaded = self.pending.pop(job['_id'], None) or await self.system.load_job(job)
+                    if loaded is None:
+                        await self.system.jobs.finish(job['_id'], 'failed', job['counters'])
+                        continue
+                    batch.append((job, loaded))
+                if not batch:
+                    continue
+                
+                # Sabse purana job leader - wahi saare messages bhejega
+                leader = batch[0][0]
+                messages = [message for _, (job_messages, _) in batch for message in job_messages]
+                leader['sources'] = [source for job, _ in batch for source in job_sources(job)]
+                leader['status'] = 'running'
+                await self.system.jobs.merge(leader['_id'], [job['_id'] for job, _ in batch[1:]], leader['sources'])
+                self.start(messages, batch[0][1][1], leader)
+                
+                for job, (_, status_msg) in batch[1:]:
+                    try:
+                        await status_msg.edit(
+                            f"📦 Ye broadcast job `{leader['_id']}` ke saath ja raha hai "
+                            f"({len(messages)} messages, ek hi audience pass)\n\n"
+                            f"Progress: /job {leader['_id']}"
+                        )
+                    except Exception:
+                        pass
+
+    async def unqueue(self, job_id):
+        """Queued job hatao - shuru hone se pehle"""
+        self.pending.pop(job_id, None)
+        return await self.system.jobs.cancel_queued(job_id)
+
+    def start(self, messages, status_msg: Message, job):
+        """Job ka background task shuru karo"""
+        run = {
+            'job_id': job['_id'],
+            'full': 'audience' not in job,
+            'running': asyncio.Event(),
+            'cancelled': False,
+            'started_at': time.time()
+        }
+        run['running'].set()
+        run['task'] = asyncio.create_task(self.execute(messages, status_msg, job, run))
+        self.active[job['_id']] = run
+        return run['task']
+
+    async def execute(self, messages, status_msg: Message, job, run):
+        try:
+            await self.system.start_broadcast(messages, status_msg, job, run)
+        except asyncio.CancelledError:
+            # Shutdown par job 'running' hi rehta hai (resume hoga), admin cancel par nahi
+            if not run['cancelled']:
+                raise
+            counters = self.system.run_counters(run)
+            await self.system.jobs.finish(job['_id'], 'cancelled', counters)
+            try:
+                await status_msg.edit(
+                    f"🛑 **Broadcast Cancelled!**\n\n"
+                    f"🆔 Job: `{job['_id']}`\n"
+                    f"✅ Delivered: {counters['success']}\n"
+                    f"❌ Failed: {counters['failed']}"
+                )
+            except Exception:
+                pass
+        finally:
+            self.active.pop(job['_id'], None)
+        
+        # Queue me pade broadcasts ab chal sakte hain
+        if run['full']:
+            await self.dispatch()
+
+    async def shutdown(self):
+        """Bot band ho raha hai - jobs cancel karo par 'running' hi rehne do
+
+        `cancelled` set nahi hota, toh har run apna checkpoint save karta hai
+        aur restart par wahin se resume hota hai.
+        """
+        tasks = [run['task'] for run in self.active.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def find(self, job_id=None):
+        """Job ID se active run do - ID na ho aur ek hi job chal raha ho toh wahi"""
+        if job_id is None:
+            return next(iter(self.active.values())) if len(self.active) == 1 else None
+        return self.active.get(job_id)
+
+    def pause(self, job_id=None):
+        run = self.find(job_id)
+        if run is None:
+            return None
+        run['running'].clear()
+        return run['job_id']
+
+    def resume(self, job_id=None):
+        run = self.find(job_id)
+        if run is None:
+            return None
+        run['running'].set()
+        return run['job_id']
+
+    def cancel(self, job_id=None):
+        run = self.find(job_id)
+        if run is None:
+            return None
+        run['cancelled'] = True
+        run['running'].set()
+        run['task'].cancel()
+        return run['job_id']
+
+class ProgressReporter:
+    """Status message har `interval` seconds me ek baar edit karo
+
+    Beech ke states drop ho jaate hain, text same ho toh edit skip. Ye alag
+    task me chalta hai, isliye edit ka FloodWait send pipeline ko nahi rokta.
+    """
+    def __init__(self, status_msg: Message, render, interval):
+        self.status_msg = status_msg
+        self.render = render
+        self.interval = interval
+        self.last_text = None
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            text = self.render()
+            if text == self.last_text:
+                continue
+            
+            wait = await self.edit(self.status_msg, text)
+            if wait:
+                # Sirf reporter rukta hai - senders chalte rehte hain
+                await asyncio.sleep(wait)
+            else:
+                self.last_text = text
+
+    # Background me chal rahe final edits (FloodWait ke baad retry) ka reference
+    retries = set()
+
+    @staticmethod
+    async def edit(status_msg: Message, text):
+        """Ek edit jo kabhi raise nahi karta - FloodWait ke seconds lautata hai
+
+        Message delete ho gaya ho ya edit fail ho, toh sirf log hota hai;
+        delivery ya job status par iska koi asar nahi.
+        """
+        try:
+            await status_msg.edit(text)
+        except MessageNotModified:
+            pass
+        except FloodWait as e:
+            return e.value
+        except Exception as e:
+            log.warning('progress_update_failed', f"Error updating progress: {e}")
+        return 0
+
+    @classmethod
+    async def post(cls, status_msg: Message, text):
+        """Ek-baar wale status (start/final report) - FloodWait par background retry
+
+        Caller ruk kar wait nahi karta, FloodWait khatam hone par ek baar
+        dobara edit hota hai.
+        """
+        wait = await cls.edit(status_msg, text)
+        if not wait:
+            return
+        
+        async def retry():
+            await asyncio.sleep(wait)
+            await cls.edit(status_msg, text)
+        
+        task = asyncio.create_task(retry())
+        cls.retries.add(task)
+        task.add_done_callback(cls.retries.discard)
+
+class PeerCache:
+    """Chat ID -> InputPeer ka in-memory LRU cache
+
+    resolve_peer har send par session SQLite se peer padhta hai, aur response
+    me aaye peers wahin event loop par synchronously likhe jaate hain. Yahan
+    broadcast se pehle peers bulk me warm hote hain (session se ek query,
+    baaki GetUsers/GetChannels ke batches), aur naye peers `pending` me jama
+    hokar ek batch me session DB me likhe jaate hain.
+
+    Pyrogram ka SQLite connection sirf event loop thread par chalta hai aur
+    uska write transaction save() tak khula rehta hai. Isliye session file
+    thread me apne alag read-only connection se padhi jati hai, aur
+    write-back Pyrogram ke hi `update_peers` se loop par hota hai - uske
+    writes ke saath serialized, commit Pyrogram ke save() par.
+    """
+    def __init__(self, client: Client, db, size, warm_batch):
+        self.client = client
+        self.db = db
+        self.size = size
+        self.warm_batch = warm_batch
+        self.peers = OrderedDict()
+        self.pending = {}
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.flush_task = None
+        self.flush_now = asyncio.Event()
+        self.last_flush = time.monotonic()
+
+    def __len__(self):
+        return len(self.peers)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups * 100 if lookups else 0.0
+
+    def put(self, chat_id, peer):
+        self.peers[chat_id] = peer
+        self.peers.move_to_end(chat_id)
+        if len(self.peers) > self.size:
+            self.peers.popitem(last=False)
+
+    async def get(self, chat_id):
+        """Cache se peer lo, na mile toh Pyrogram se resolve karo"""
+        peer = self.peers.get(chat_id)
+        if peer is not None:
+            self.hits += 1
+            self.peers.move_to_end(chat_id)
+            return peer
+        
+        self.misses += 1
+        peer = await self.client.resolve_peer(chat_id)
+        self.put(chat_id, peer)
+        return peer
+
+    SESSION_QUERY = "SELECT id, access_hash, type FROM peers ORDER BY last_update_on DESC LIMIT ?"
+
+    def read_session(self, path):
+        """Session file ke latest peers alag read-only connection se padho (thread me chalta hai)"""
+        conn = sqlite3.connect(f"{pathlib.Path(path).resolve().as_uri()}?mode=ro", uri=True, timeout=5)
+        try:
+            return conn.execute(self.SESSION_QUERY, (self.size,)).fetchall()
+        finally:
+            conn.close()
+
+    async def load(self):
+        """Session me pehle se saved peers cache me daalo - ek baar"""
+        if self.loaded:
+            return
+        self.loaded = True
+        
+        try:
+            # Memory storage ki koi file nahi - wahan Pyrogram ke connection se loop par hi
+            path = getattr(self.client.storage, 'database', None)
+            if path:
+                rows = await self.db.run(self.read_session, path, timeout=DB_SCAN_TIMEOUT)
+            else:
+                rows = self.client.storage.conn.execute(self.SESSION_QUERY, (self.size,)).fetchall()
+        except Exception as e:
+            log.error('peers_load_failed', f"Error loading session peers: {e}")
+            return
+        
+        # Purane pehle daalo taaki LRU me naye peers aage rahein
+        for peer_id, access_hash, peer_type in reversed(rows):
+            try:
+                self.put(peer_id, get_input_peer(peer_id, access_hash, peer_type))
+            except Exception:
+                continue
+
+    async def warm(self, chat_ids):
+        """Cache me na mile peers bulk me resolve karo - users/channels ke batches"""
+        users, channels = [], []
+        for chat_id in chat_ids:
+            if chat_id in self.peers:
+                continue
+            peer_type = utils.get_peer_type(chat_id)
+            if peer_type == 'user':
+                users.append(raw.types.InputUser(user_id=chat_id, access_hash=0))
+            elif peer_type == 'channel':
+                channels.append(raw.types.InputChannel(channel_id=utils.get_channel_id(chat_id), access_hash=0))
+            else:
+                # Basic group ke liye access hash nahi chahiye
+                self.put(chat_id, raw.types.InputPeerChat(chat_id=-chat_id))
+        
+        for start in range(0, len(users), self.warm_batch):
+            try:
+                result = await self.client.invoke(
+                    raw.functions.users.GetUsers(id=users[start:start + self.warm_batch])
+                )
+            except Exception as e:
+                # Ye peers send ke waqt resolve_peer se aa jayenge
+                log.warning('peer_warmup_failed', f"Peer warm-up (users) failed: {e}", kind='users', sample=True)
+                continue
+            self.remember(users=result)
+        
+        for start in range(0, len(channels), self.warm_batch):
+            try:
+                result = await self.client.invoke(
+                    raw.functions.channels.GetChannels(id=channels[start:start + self.warm_batch])
+                )
+            except Exception as e:
+                log.warning('peer_warmup_failed', f"Peer warm-up (channels) failed: {e}", kind='channels', sample=True)
+                continue
+            self.remember(chats=result.chats)
+
+    def store(self, peer_id, peer, row):
+        """Peer cache me daalo - naya ya badla hua ho toh write-back ke liye bhi"""
+        cached = self.peers.get(peer_id)
+        if cached is not None and getattr(cached, 'access_hash', 0) == getattr(peer, 'access_hash', 0):
+            return
+        self.put(peer_id, peer)
+        self.pending[peer_id] = row
+
+    def remember(self, users=(), chats=()):
+        """Response ke users/chats (Pyrogram ke fetch_peers jaisa) cache aur session ke liye"""
+        for user in users:
+            if not isinstance(user, raw.types.User) or user.access_hash is None:
+                continue
+            username = user.username.lower() if user.username else None
+            self.store(
+                user.id,
+                raw.types.InputPeerUser(user_id=user.id, access_hash=user.access_hash),
+                (user.id, user.access_hash, 'bot' if user.bot else 'user', username, user.phone)
+            )
+        
+        for chat in chats:
+            if isinstance(chat, raw.types.Chat):
+                self.store(-chat.id, raw.types.InputPeerChat(chat_id=chat.id), (-chat.id, 0, 'group', None, None))
+            elif isinstance(chat, raw.types.Channel) and chat.access_hash is not None:
+                peer_id = utils.get_channel_id(chat.id)
+                username = chat.username.lower() if chat.username else None
+                self.store(
+                    peer_id,
+                    raw.types.InputPeerChannel(channel_id=chat.id, access_hash=chat.access_hash),
+                    (peer_id, chat.access_hash, 'channel' if chat.broadcast else 'supergroup', username, None)
+                )
+        
+        if self.pending:
+            self.maybe_flush()
+
+    def maybe_flush(self):
+        """Background write-back schedule karo - batch bharte hi turant"""
+        if len(self.pending) >= PEER_FLUSH_SIZE:
+            self.flush_now.set()
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        delay = PEER_FLUSH_INTERVAL - (time.monotonic() - self.last_flush)
+        if delay > 0 and not self.flush_now.is_set():
+            try:
+                await asyncio.wait_for(self.flush_now.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        self.flush_now.clear()
+        await self.flush()
+
+    async def flush(self):
+        """Pending peers session storage me likho"""
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        
+        batch, self.pending = self.pending, {}
+        try:
+            await self.client.storage.update_peers(list(batch.values()))
+        except Exception as e:
+            log.error('peers_save_failed', f"Error saving session peers: {e}")
+            for peer_id, row in batch.items():
+                self.pending.setdefault(peer_id, row)
+
+    async def close(self):
+        """Chal raha write-back khatam karo aur baaki peers likh do"""
+        if self.flush_task and not self.flush_task.done():
+            self.flush_now.set()
+            await self.flush_task
+        await self.flush()
+
+class AudienceSnapshot:
+    """Poori audience ki sorted, deduplicated int64 file - mmap se bina copy padhi jati hai
+
+    Full rebuild teeno collections ka sorted merge hai. Uske baad refresh sirf
+    delta padhta hai: watermark ke baad bane documents (_id se) aur
+    `blocked_at` se inactive hue chats. Bot ke khud delete kiye chats
+    `discard` se hat jaate hain, baaki bahar ke deletes periodic rebuild me.
+
+    Delta file me turant nahi likha jata - `added` (sorted) aur `deleted`
+    memory me rehte hain aur iteration/count ke waqt merge hote hain. File
+    rewrite (compaction) background refresh me hota hai jab delta bada ya
+    purana ho jaye. Broadcast start sirf delta read ka wait karta hai.
+    """
+    ITEM_SIZE = array('q').itemsize
+
+    def __init__(self, path, database, db, scan_cursor, enabled=True):
+        self.path = path
+        self.meta_path = path + '.json'
+        self.database = database
+        self.db = db
+        self.scan_cursor = scan_cursor
+        self.enabled = enabled
+        self.view = None
+        self.meta = None
+        self.opened = False
+        self.stale = False
+        self.removed = set()
+        self.added = []
+        self.deleted = frozenset()
+        self.watermark = None
+        self.refreshed = 0.0
+        self.compacted = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.task = None
+
+    def __len__(self):
+        if self.view is None:
+            return 0
+        return len(self.view) + len(self.added) - len(self.deleted)
+
+    @property
+    def age(self):
+        return time.time() - self.meta['built_at'] if self.meta else math.inf
+
+    def needs_rebuild(self):
+        return self.view is None or self.stale or self.age > SNAPSHOT_REBUILD_INTERVAL
+
+    def due(self):
+        # Bot ke khud delete kiye chats agle broadcast se pehle hi hatein
+        return (self.needs_rebuild() or bool(self.removed)
+                or time.monotonic() - self.refreshed >= SNAPSHOT_REFRESH_INTERVAL)
+
+    def needs_compact(self):
+        delta = len(self.added) + len(self.deleted)
+        return delta >= SNAPSHOT_COMPACT_SIZE or (delta > 0 and time.monotonic() - self.compacted > SNAPSHOT_COMPACT_INTERVAL)
+
+    @staticmethod
+    def unique(chat_ids):
+        """Sorted stream se duplicates hatao"""
+        last = None
+        for chat_id in chat_ids:
+            if chat_id != last:
+                last = chat_id
+                yield chat_id
+
+    @staticmethod
+    def field_ids(cursor, field):
+        for doc in cursor:
+            chat_id = doc.get(field)
+            if isinstance(chat_id, int):
+                yield chat_id
+
+    @staticmethod
+    def bounds(view, segment=None, after=None):
+        """Segment aur `after` ki index range - users positive, groups negative IDs"""
+        kind = (segment or {}).get('kind', 'all')
+        start = bisect.bisect_right(view, 0) if kind == 'users' else 0
+        end = bisect.bisect_left(view, 0) if kind == 'groups' else len(view)
+        if after is not None:
+            start = max(start, bisect.bisect_right(view, after))
+        return start, end
+
+    @staticmethod
+    def in_segment(chat_id, segment=None):
+        kind = (segment or {}).get('kind', 'all')
+        return kind == 'all' or (chat_id > 0) == (kind == 'users')
+
+    def count(self, segment=None):
+        start, end = self.bounds(self.view, segment)
+        added_start, added_end = self.bounds(self.added, segment)
+        deleted = sum(1 for chat_id in self.deleted if self.in_segment(chat_id, segment))
+        return max(0, end - start) + added_end - added_start - deleted
+
+    async def iter_chats(self, after=None, segment=None):
+        """Snapshot se sorted chat IDs, delta saath me merge - har batch ke baad loop ko mauka"""
+        # Start par references - beech me refresh/compaction naye objects banata hai
+        view, added, deleted = self.view, self.added, self.deleted
+        deleted_ids = sorted(deleted)
+        start, end = self.bounds(view, segment, after)
+        a, added_end = self.bounds(added, segment, after)
+        for i in range(start, end, AUDIENCE_BATCH_SIZE):
+            chunk = view[i:min(i + AUDIENCE_BATCH_SIZE, end)]
+            # Delta is batch ki range me na ho toh seedha slice
+            j = bisect.bisect_right(added, chunk[-1], a, added_end)
+            k = bisect.bisect_left(deleted_ids, chunk[0])
+            if j > a or (k < len(deleted_ids) and deleted_ids[k] <= chunk[-1]):
+                chunk = [chat_id for chat_id in heapq.merge(chunk, added[a:j]) if chat_id not in deleted]
+                a = j
+            for chat_id in chunk:
+                yield chat_id
+            await asyncio.sleep(0)
+        # File ke last chat ke baad wale naye chats
+        for i in range(a, added_end, AUDIENCE_BATCH_SIZE):
+            for chat_id in added[i:min(i + AUDIENCE_BATCH_SIZE, added_end)]:
+                yield chat_id
+            await asyncio.sleep(0)
+
+    def open(self):
+        """Disk se snapshot mmap karo (thread me chalta hai)"""
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        size = os.path.getsize(self.path)
+        if size != meta['count'] * self.ITEM_SIZE:
+            raise ValueError("snapshot file meta se match nahi karti")
+        if not size:
+            return memoryview(b'').cast('q'), meta
+        with open(self.path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(mapped).cast('q'), meta
+
+    def save_meta(self, meta):
+        tmp = self.meta_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.meta_path)
+
+    def write(self, chat_ids, meta):
+        """Sorted chat IDs nayi file me likho aur atomically replace karo (thread me chalta hai)
+
+        Purana mmap chal rahe broadcasts ke paas valid rehta hai - replace
+        sirf naye readers ko nayi file deta hai.
+        """
+        tmp = self.path + '.tmp'
+        count = 0
+        with open(tmp, 'wb') as f:
+            buffer = array('q')
+            for chat_id in chat_ids:
+                buffer.append(chat_id)
+                if len(buffer) >= AUDIENCE_BATCH_SIZE:
+                    buffer.tofile(f)
+                    count += len(buffer)
+                    buffer = array('q')
+            buffer.tofile(f)
+            count += len(buffer)
+        os.replace(tmp, self.path)
+        self.save_meta(dict(meta, count=count))
+        return self.open()
+
+    def rebuild(self, started):
+        """Teeno collections ka sorted merge disk par - poora index scan (thread me chalta hai)"""
+        cursors = [self.scan_cursor(collection, field) for collection, field in AUDIENCE_SOURCES]
+        try:
+            streams = [self.field_ids(cursor, field) for cursor, (_, field) in zip(cursors, AUDIENCE_SOURCES)]
+            return self.write(self.unique(heapq.merge(*streams)), {'built_at': started, 'watermark': started})
+        finally:
+            for cursor in cursors:
+                cursor.close()
+
+    def read_delta(self, watermark):
+        """Watermark ke baad naye aur inactive hue chats (thread me chalta hai)"""
+        # Alag writers ke ObjectIds thode aage peeche ho sakte hain - skew jitna overlap
+        since = datetime.utcfromtimestamp(watermark - SNAPSHOT_ID_SKEW)
+        added, removed = set(), set()
+        for collection, field in AUDIENCE_SOURCES:
+            coll = self.database[collection]
+            numeric = {'$gte': -math.inf}
+            query = {'_id': {'$gte': ObjectId.from_datetime(since)}, field: numeric, **ACTIVE_FILTER}
+            added.update(self.field_ids(coll.find(query, {field: 1, '_id': 0}), field))
+            query = {'blocked_at': {'$gte': since}, field: numeric}
+            removed.update(self.field_ids(coll.find(query, {field: 1, '_id': 0}), field))
+        return added, removed
+
+    def apply(self, view, added, deleted, meta):
+        """Purane snapshot me delta merge karke nayi file - compaction (thread me chalta hai)"""
+        merged = self.unique(heapq.merge(view, added))
+        return self.write((chat_id for chat_id in merged if chat_id not in deleted), meta)
+
+    def merge_delta(self, added, removed):
+        """Delta memory me jodo - `added` me sirf file se bahar ke, `deleted` me sirf file ke chats"""
+        revived = added - removed
+        current = set(self.added) | {chat_id for chat_id in revived if not self.contains(chat_id)}
+        self.added = sorted(current - removed)
+        self.deleted = frozenset((self.deleted - revived) | {chat_id for chat_id in removed if self.contains(chat_id)})
+
+    def contains(self, chat_id):
+        """Chat snapshot file (view) me hai? Delta ko nahi dekhta"""
+        i = bisect.bisect_left(self.view, chat_id)
+        return i < len(self.view) and self.view[i] == chat_id
+
+    async def load(self):
+        """Pichla snapshot disk se ek baar - na mile ya kharab ho toh rebuild hoga"""
+        if self.opened:
+            return
+        async with self.lock:
+            if self.opened:
+                return
+            self.opened = True
+            try:
+                self.view, self.meta = await self.db.run(self.open)
+                self.watermark = self.meta['watermark']
+            except (OSError, ValueError, KeyError):
+                self.view = self.meta = None
+                pass
+
+    async def current(self):
+        """Snapshot abhi use ho sakta hai? Delta ka wait hota hai, compaction aur rebuild background me
+
+        Delta sirf `_id`/`blocked_at` ki chhoti range query hai - iske bina
+        idle ke baad shuru hua broadcast pichle refresh ke baad aaye chats
+        chhod deta. File rewrite kabhi yahan nahi hota.
+        """
+        if not self.enabled:
+            return False
+        await self.load()
+        if self.needs_rebuild():
+            self.schedule_refresh()
+            return False
+        if self.due():
+            await self.refresh(compact=False)
+            if self.needs_compact():
+                self.schedule_refresh()
+        # Delta read fail hua ho toh purana view nahi - Mongo scan
+        return not (self.needs_rebuild() or self.due())
+
+    def schedule_refresh(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.refresh())
+        return self.task
+
+    async def refresh(self, compact=True):
+        """Snapshot taaza karo - zarurat ho toh rebuild, warna delta (aur `compact` par file rewrite)"""
+        if not self.enabled:
+            return
+        await self.load()
+        async with self.lock:
+            rebuild, delta = self.needs_rebuild(), self.due()
+            if not delta and not (compact and self.needs_compact()):
+                return
+            
+            started = time.time()
+            pending, self.removed = self.removed, set()
+            try:
+                if rebuild:
+                    self.stale = False
+                    self.view, self.meta = await self.db.run(self.rebuild, started, timeout=DB_SCAN_TIMEOUT)
+                    self.added, self.deleted = [], frozenset()
+                    self.watermark = started
+                    self.compacted = time.monotonic()
+                    log.info(
+                        'snapshot_rebuilt',
+                        f"🗂️ Audience snapshot rebuilt: {len(self)} chats in {format_duration(time.time() - started)}",
+                        chats=len(self), seconds=round(time.time() - started, 3)
+                    )
+                    self.refreshed = time.monotonic()
+                else:
+                    if delta:
+                        added, removed = await self.db.run(self.read_delta, self.watermark, timeout=DB_SCAN_TIMEOUT)
+                        self.merge_delta(added, removed | pending)
+                        self.watermark = started
+                        self.refreshed = time.monotonic()
+                    if compact and self.needs_compact():
+                        # File ka watermark wahi jahan tak delta usme merge hua
+                        meta = dict(self.meta, watermark=self.watermark)
+                        self.view, self.meta = await self.db.run(self.apply, self.view, self.added, self.deleted, meta)
+                        self.added, self.deleted = [], frozenset()
+                        self.compacted = time.monotonic()
+            except Exception as e:
+                log.error('snapshot_refresh_failed', f"Error refreshing audience snapshot: {e}", rebuild=rebuild)
+                self.removed |= pending
+                self.stale = self.stale or rebuild
+
+    def discard(self, chat_ids):
+        """Bot ne khud chats delete kiye - agle refresh me snapshot se hatenge"""
+        self.removed.update(chat_ids)
+
+    def invalidate(self):
+        """Inactive chats wapas aaye - agla refresh poora rebuild karega"""
+        self.stale = True
+
+class BroadcastPayload:
+    """Broadcast message ek baar compile karo - har send sirf ek raw request
+
+    Message.copy har chat ke liye message type check karta hai, entities aur
+    keyboard dobara banata hai aur response ko Message me parse karta hai.
+    Yahan file reference, entities aur keyboard job ke start par ek baar
+    bante hain. Poll/contact/location jaise types copy par hi chalte hain.
+    """
+    MEDIA_TYPES = ('photo', 'video', 'animation', 'audio', 'document', 'voice', 'sticker', 'video_note')
+
+    def __init__(self, message: Message, media=None, text='', entities=None,
+                 reply_markup=None, no_webpage=False, fallback=False):
+        self.message = message
+        self.media = media
+        self.text = text
+        self.entities = entities
+        self.reply_markup = reply_markup
+        self.no_webpage = no_webpage
+        self.fallback = fallback
+
+    @classmethod
+    async def compile(cls, client: Client, message: Message):
+        try:
+            reply_markup = await message.reply_markup.write(client) if message.reply_markup else None
+            
+            if message.text:
+                parsed = await utils.parse_text_entities(client, message.text, ParseMode.DISABLED, message.entities)
+                return cls(
+                    message,
+                    text=parsed['message'],
+                    entities=parsed['entities'],
+                    reply_markup=reply_markup,
+                    no_webpage=not message.web_page
+                )
+            
+            for media_type in cls.MEDIA_TYPES:
+                media = getattr(message, media_type, None)
+                if media is None:
+                    continue
+                
+                # Sticker aur video note par caption nahi hota
+                parsed = {'message': '', 'entities': None}
+                if media_type not in ('sticker', 'video_note'):
+                    parsed = await utils.parse_text_entities(
+                        client, message.caption or '', ParseMode.DISABLED, message.caption_entities
+                    )
+                return cls(
+                    message,
+                    media=utils.get_input_media_from_file_id(media.file_id),
+                    text=parsed['message'],
+                    entities=parsed['entities'],
+                    reply_markup=reply_markup
+                )
+        except Exception as e:
+            log.warning('payload_compile_failed', f"Error compiling broadcast payload, using copy: {e}")
+        
+        return cls(message, fallback=True)
+
+    async def send(self, client: Client, chat_id, peers: PeerCache):
+        """Ek chat ko payload bhejo - peer cache se, session storage ko chhue bina"""
+        if self.fallback:
+            # Copy ke andar ke calls bhi FloodWait par na soyen - BackoffGate aur AIMD tak aaye
+            token = invoke_sleep_threshold.set(0)
+            try:
+                return await self.message.copy(chat_id)
+            finally:
+                invoke_sleep_threshold.reset(token)
+        
+        peer = await peers.get(chat_id)
+        if self.media is not None:
+            request = raw.functions.messages.SendMedia(
+                peer=peer,
+                media=self.media,
+                message=self.text,
+                entities=self.entities,
+                reply_markup=self.reply_markup,
+                random_id=client.rnd_id()
+            )
+        else:
+            request = raw.functions.messages.SendMessage(
+                peer=peer,
+                message=self.text,
+                entities=self.entities,
+                no_webpage=self.no_webpage,
+                reply_markup=self.reply_markup,
+                random_id=client.rnd_id()
+            )
+        
+        # client.invoke har response ke peers SQLite me likhta hai - seedha session
+        # sleep_threshold=0: chhoti FloodWait bhi send_to_chat tak aaye, worker me na soye
+        result = await client.session.invoke(request, sleep_threshold=0)
+        peers.remember(users=getattr(result, 'users', ()), chats=getattr(result, 'chats', ()))
+        return result
+
+def sent_message_id(result):
+    """Send response se Telegram message ID nikalo (raw updates ya copy ka Message)"""
+    message_id = getattr(result, 'id', None)
+    if isinstance(message_id, int):
+        return message_id
+    for update in getattr(result, 'updates', ()):
+        if isinstance(update, raw.types.UpdateMessageID):
+            return update.id
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return update.message.id
+    return None
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+def fetch_batch(cursor, size):
+    """Cursor se agle `size` documents lo (thread me chalta hai)"""
+    return list(itertools.islice(cursor, size))
 
 class BroadcastSystem:
     def __init__(self):
-        self.mongo_client = MongoClient(MONGO_URL)
-        self.anon_db = self.mongo_client["Yukki"]
+        # connect=False - connection aur server discovery pehli DB call par, startup phases me
+        self.mongo_client = MongoClient(
+            MONGO_URL,
+            connect=False,
+            maxPoolSize=MONGO_POOL_SIZE,
+            serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_TIMEOUT_MS * 3
+        )
+        self.anon_db = self.mongo_client[ANON_DB_NAME]
+        self.bot_db = self.mongo_client[BOT_DB_NAME]
+        self.db = AsyncDB(DB_THREADS, DB_TIMEOUT)
+        self.stats_cache = StatsCache(STATS_CACHE_TTL, self.load_database_stats)
+        self.segment_sizes = OrderedDict()
+        self.snapshot = AudienceSnapshot(AUDIENCE_SNAPSHOT_FILE, self.anon_db, self.db, self.scan_cursor, AUDIENCE_SNAPSHOT)
+        self.readiness = Readiness(('mongo', 'indexes', 'failed_chats'), ('jobs', 'snapshot'))
+        
+        # Scans ke liye read preference, aur kaunse collections indexed hain
+        self.scan_read_preference = READ_PREFERENCES.get(MONGO_READ_PREFERENCE, ReadPreference.PRIMARY)
+        self.indexed = {}
         
         self.broadcast_message = None
         self.broadcast_keyboard = None
-        self.is_broadcasting = False
         
-        self.failed_chats = self.load_failed_chats()
+        # Ek hi limiter (aur FloodWait gate) sabhi senders ke beech shared hai
+        self.gate = BackoffGate()
+        self.limiter = RateLimiter(
+            BROADCAST_RATE,
+            burst=BROADCAST_BURST,
+            chat_interval=PER_CHAT_INTERVAL,
+            group_interval=GROUP_CHAT_INTERVAL,
+            gate=self.gate
+        )
+        self.rate_control = RateController(
+            self.limiter,
+            BROADCAST_RATE_FLOOR,
+            BROADCAST_RATE_CEILING,
+            RATE_INCREASE_STEP,
+            RATE_INCREASE_INTERVAL,
+            RATE_DECREASE_FACTOR
+        )
+        
+        self.peers = PeerCache(app, self.db, PEER_CACHE_SIZE, PEER_WARM_BATCH)
+        
+        self.jobs = JobStore(self.bot_db.broadcast_jobs, self.db)
+        self.deliveries = DeliveryLog(self.bot_db.deliveries, self.db, DELIVERY_LOG, DELIVERY_LOG_TTL_DAYS)
+        self.scheduler = JobScheduler(self)
+        self.failed_chats = FailureStore(
+            self.bot_db.failed_chats,
+            self.db,
+            FAILURE_THRESHOLD,
+            sources=[(self.anon_db[collection], field) for collection, field in AUDIENCE_SOURCES],
+            markers=self.bot_db.migrations
+        )
         
         self.stats = {
             'total_sent': 0,
             'total_failed': 0,
             'total_blocked': 0,
             'flood_waits': 0,
+            'retried': 0,
             'current_broadcast': 0
         }
 
-    def load_failed_chats(self):
+    @property
+    def is_broadcasting(self):
+        return bool(self.scheduler.active)
+
+    def ensure_indexes(self):
+        """Chat ID fields par index declare aur verify karo"""
+        for collection, field in AUDIENCE_SOURCES:
+            coll = self.anon_db[collection]
+            try:
+                if ENSURE_INDEXES:
+                    coll.create_index(self.scan_index(field), background=True)
+                    # Segments ka 'since' filter bhi index se chale (_id par pehle se hai)
+                    if SEGMENT_SINCE_FIELD != '_id':
+                        coll.create_index(SEGMENT_SINCE_FIELD, background=True)
+                    # Snapshot delta inactive hue chats isse padhta hai
+                    coll.create_index('blocked_at', sparse=True, background=True)
+                
+                keys = [info['key'] for info in coll.index_information().values()]
+                self.indexed[collection] = self.scan_index(field) in keys
+            except Exception as e:
+                log.error('index_check_failed', f"Error ensuring index on {collection}.{field}: {e}", collection=collection)
+                self.indexed[collection] = False
+            
+            if not self.indexed[collection]:
+                log.warning('index_missing', f"⚠️ {collection}.{field} par index nahi hai - scans slow honge", collection=collection)
+        
+        self.deliveries.ensure_indexes()
+        return self.indexed
+
+    async def ping(self):
+        await self.db.run(self.mongo_client.admin.command, 'ping', timeout=MONGO_TIMEOUT_MS / 1000 * 2)
+
+    async def check_indexes(self):
+        indexed = await self.db.run(self.ensure_indexes, timeout=DB_SCAN_TIMEOUT)
+        missing = [collection for collection, ok in indexed.items() if not ok]
+        if missing:
+            raise RuntimeError(f"index missing: {', '.join(missing)}")
+
+    async def load_failed_chats(self):
+        await self.failed_chats.load()
+        if not self.failed_chats.loaded:
+            raise RuntimeError("failed chats load nahi hue")
+
+    async def start_services(self, warm=True):
+        """Startup phases background me - Mongo, indexes aur failed chats ek saath
+
+        Handlers pehle se serve kar rahe hote hain. Core phases ke baad
+        adhoore jobs resume hote hain aur snapshot/segment sizes warm hote hain.
+        """
+        readiness = self.readiness
+        await asyncio.gather(
+            readiness.run('mongo', self.ping),
+            readiness.run('indexes', self.check_indexes),
+            readiness.run('failed_chats', self.load_failed_chats)
+        )
+        readiness.settled.set()
+        log.info(
+            'startup_ready' if readiness.ready else 'startup_degraded',
+            f"🚦 Bot {'ready' if readiness.ready else 'degraded'} in {readiness.elapsed:.1f}s"
+            + (f" (failed: {', '.join(readiness.failed())})" if readiness.failed() else ""),
+            seconds=round(readiness.elapsed, 3),
+            phases={name: phase['seconds'] and round(phase['seconds'], 3) for name, phase in readiness.phases.items()}
+        )
+        
+        if warm:
+            # Adhoore broadcasts aur segment sizes - readiness inka wait nahi karti
+            await asyncio.gather(
+                readiness.run('jobs', self.resume_jobs),
+                readiness.run('snapshot', self.warm_segments)
+            )
+
+    @staticmethod
+    def scan_index(field):
+        """Audience scans ka compound index - chat id + inactive flag"""
+        return [(field, 1), ('inactive', 1)]
+
+    @staticmethod
+    def segment_filter(field, segment=None, after=None):
+        """Segment ka Mongo filter - users/groups chat ID ki range hai, since date field par"""
+        segment = segment or {'kind': 'all', 'since': None}
+        
+        # Users positive, groups negative IDs - dono index par range hi hain
+        # Numeric range filter null/missing ko bahar rakhta hai - tabhi query covered hoti hai
+        bounds = {}
+        if segment['kind'] == 'users':
+            bounds['$gt'] = 0
+        elif segment['kind'] == 'groups':
+            bounds['$lt'] = 0
+        if after is not None:
+            bounds['$gt'] = max(after, bounds.get('$gt', after))
+        if '$gt' not in bounds:
+            bounds['$gte'] = -math.inf
+        
+        query = {field: bounds, **ACTIVE_FILTER}
+        since = segment.get('since')
+        if since is not None:
+            query[SEGMENT_SINCE_FIELD] = {'$gte': ObjectId.from_datetime(since) if SEGMENT_SINCE_FIELD == '_id' else since}
+        return query
+
+    def scan_cursor(self, collection, field, segment=None, after=None):
+        """Active chat IDs ka covered-index scan - sirf index se, secondary se"""
+        coll = self.anon_db[collection].with_options(read_preference=self.scan_read_preference)
+        
+        # Dead chats yahin index par hi skip ho jaate hain
+        # Index order me sorted - resume aur merge ke liye
+        cursor = coll.find(
+            self.segment_filter(field, segment, after),
+            {field: 1, '_id': 0},
+            batch_size=AUDIENCE_BATCH_SIZE,
+            allow_disk_use=True
+        ).sort(field, 1)
+        # 'since' ho toh planner date index aur chat ID index me se khud chune
+        if self.indexed.get(collection) and not (segment and segment.get('since')):
+            cursor = cursor.hint(self.scan_index(field))
+        return cursor
+
+    def count_unique_exact(self, segment=None):
+        """Unique chats server par count karo - $unionWith + $group (thread me chalta hai)
+
+        Segment ka filter har collection ke pehle $match me hai, toh count bhi
+        index range se hi hota hai.
+        """
+        (first, first_field), rest = AUDIENCE_SOURCES[0], AUDIENCE_SOURCES[1:]
+        pipeline = [
+            {'$match': self.segment_filter(first_field, segment)},
+            {'$project': {'_id': 0, 'id': f'${first_field}'}}
+        ]
+        for collection, field in rest:
+            pipeline.append({'$unionWith': {
+                'coll': collection,
+                'pipeline': [
+                    {'$match': self.segment_filter(field, segment)},
+                    {'$project': {'_id': 0, 'id': f'${field}'}}
+                ]
+            }})
+        pipeline += [
+            {'$group': {'_id': '$id'}},
+            {'$count': 'total'}
+        ]
+        
+        coll = self.anon_db[first].with_options(read_preference=self.scan_read_preference)
+        result = list(coll.aggregate(pipeline, allowDiskUse=True))
+        return result[0]['total'] if result else 0
+
+    def count_unique_approx(self, segment=None):
+        """HyperLogLog se unique chats ka andaza - memory fixed rehti hai (thread me chalta hai)"""
+        hll = HyperLogLog()
+        for collection, field in AUDIENCE_SOURCES:
+            with self.scan_cursor(collection, field, segment) as cursor:
+                for doc in cursor:
+                    chat_id = doc.get(field)
+                    if isinstance(chat_id, int):
+                        hll.add(chat_id)
+        return hll.count()
+
+    async def estimate_audience(self):
+        """Progress ke liye audience ka andaza (collection metadata se)"""
+        total = 0
+        for collection, _ in AUDIENCE_SOURCES:
+            try:
+                total += await self.db.run(self.anon_db[collection].estimated_document_count)
+            except Exception as e:
+                log.error('estimate_failed', f"Error estimating {collection}: {e}", collection=collection)
+        return total
+
+    async def stream_source(self, collection, field, after=None, segment=None):
+        """Ek collection se sorted chat IDs - agla batch pehle se fetch hota rehta hai"""
+        cursor = self.scan_cursor(collection, field, segment, after)
+        pending = asyncio.ensure_future(self.db.run(fetch_batch, cursor, AUDIENCE_BATCH_SIZE))
         try:
-            if os.path.exists(FAILED_CHATS_FILE):
-                with open(FAILED_CHATS_FILE, 'r') as f:
-                    return json.load(f)
-        except:
-            pass
-        return {}
+            while True:
+                # Merge agle batch ke liye kitna ruka - scan ka asli cost
+                waited = time.perf_counter()
+                docs = await pending
+                SCAN_WAIT_SECONDS.observe(time.perf_counter() - waited, collection=collection)
+                if not docs:
+                    break
+                pending = asyncio.ensure_future(self.db.run(fetch_batch, cursor, AUDIENCE_BATCH_SIZE))
+                
+                for doc in docs:
+                    chat_id = doc.get(field)
+                    if isinstance(chat_id, int):
+                        yield chat_id
+        finally:
+            if not pending.done():
+                pending.cancel()
+            await self.db.run(cursor.close)
 
-    def save_failed_chats(self):
+    async def iter_audience(self, after=None, segment=None):
+        """MongoDB se chat IDs stream karo - cursors padhte padhte hi send shuru
+
+        Teeno collections index order me aati hain, unka sorted merge hota hai.
+        Duplicates merge me saath saath aate hain, toh dedup ke liye koi set
+        nahi chahiye, aur `after` se kisi bhi position se resume ho sakta hai.
+        `segment` ka filter har cursor ki query me hi jata hai. Snapshot taaza
+        ho toh Mongo scan hota hi nahi - IDs seedhe mmap file se aate hain.
+        """
+        if not (segment and segment.get('since')) and await self.snapshot.current():
+            async for chat_id in self.snapshot.iter_chats(after, segment):
+                yield chat_id
+            return
+        
+        streams = [self.stream_source(collection, field, after, segment) for collection, field in AUDIENCE_SOURCES]
+        heap = []
         try:
-            with open(FAILED_CHATS_FILE, 'w') as f:
-                json.dump(self.failed_chats, f, indent=2)
-        except Exception as e:
-            print(f"Error saving failed chats: {e}")
+            for i, stream in enumerate(streams):
+                try:
+                    heap.append((await stream.__anext__(), i))
+                except StopAsyncIteration:
+                    pass
+            heapq.heapify(heap)
+            
+            last = None
+            while heap:
+                chat_id, i = heap[0]
+                try:
+                    heapq.heapreplace(heap, (await streams[i].__anext__(), i))
+                except StopAsyncIteration:
+                    heapq.heappop(heap)
+                
+                if chat_id != last:
+                    last = chat_id
+                    yield chat_id
+        finally:
+            for stream in streams:
+                await stream.aclose()
 
-    def get_all_chats(self):
-        """MongoDB se sabhi users aur groups collect karo"""
-        chat_ids = set()
+    def job_audience(self, job, after=None):
+        """Job ki audience - poori audience, ya resend job ke liye delivery log ka subset"""
+        audience = job.get('audience')
+        if audience:
+            return self.deliveries.iter_chats(audience['job_id'], audience['statuses'], after)
+        return self.iter_audience(after, job_segment(job))
+
+    async def audience_size(self, job):
+        audience = job.get('audience')
+        if audience:
+            try:
+                return await self.deliveries.count(audience['job_id'], audience['statuses'])
+            except Exception as e:
+                log.error('resend_count_failed', f"Error counting resend audience: {e}", job_id=audience['job_id'])
+                return 0
         
+        # Segment ka cached size - pehli baar poori audience ke liye metadata ka andaza
+        segment = job_segment(job)
+        if segment_key(segment) == 'all' and self.stats_cache.values is None:
+            return await self.estimate_audience()
+        return await self.segment_size(segment)
+
+    def segment_cache(self, segment):
+        """Segment ke size ka StatsCache - poori audience ka size /stats wale cache me hai"""
+        key = segment_key(segment)
+        if key == 'all':
+            return self.stats_cache
+        cache = self.segment_sizes.get(key)
+        if cache is None:
+            cache = self.segment_sizes[key] = StatsCache(
+                STATS_CACHE_TTL, functools.partial(self.load_segment_size, segment)
+            )
+            if len(self.segment_sizes) > SEGMENT_CACHE_SIZE:
+                self.segment_sizes.popitem(last=False)
+        else:
+            self.segment_sizes.move_to_end(key)
+        return cache
+
+    async def count_segment(self, segment=None):
+        """Segment ke unique chats - snapshot se bisect, warna Mongo par count"""
+        if not (segment and segment.get('since')) and await self.snapshot.current():
+            return self.snapshot.count(segment)
+        counter = self.count_unique_approx if STATS_MODE == 'approx' else self.count_unique_exact
+        return await self.db.run(counter, segment, timeout=DB_SCAN_TIMEOUT)
+
+    async def load_segment_size(self, segment):
+        """Segment cache ka loader - unique chats jo segment me aate hain"""
         try:
-            # Users collection
-            for user in self.anon_db.tgusersdb.find({}, {'user_id': 1}):
-                if 'user_id' in user:
-                    chat_ids.add(user['user_id'])
-            
-            # Assistants/Groups collection
-            for group in self.anon_db.assistants.find({}, {'chat_id': 1}):
-                if 'chat_id' in group:
-                    chat_ids.add(group['chat_id'])
-            
-            # Chats collection
-            for chat in self.anon_db.chats.find({}, {'chat_id': 1}):
-                if 'chat_id' in chat:
-                    chat_ids.add(chat['chat_id'])
-                    
+            return {'total_unique': await self.count_segment(segment)}
         except Exception as e:
-            print(f"Error fetching chats from MongoDB: {e}")
-        
-        return list(chat_ids)
+            log.error('segment_count_failed', f"Error counting segment {segment_key(segment)}: {e}", segment=segment_key(segment))
+            return None
+
+    async def segment_size(self, segment):
+        """Segment me kitne chats hain (cached)"""
+        values = await self.segment_cache(segment).get()
+        return values['total_unique'] if values else 0
+
+    async def warm_segments(self):
+        """Startup par segment sizes load karo - confirmation prompt turant count dikhaye"""
+        # Snapshot pehle - sizes phir bina scan ke bisect se
+        await self.snapshot.refresh()
+        await asyncio.gather(*(self.segment_size({'kind': kind, 'since': None}) for kind in SEGMENT_KINDS))
 
-    def get_database_stats(self):
-        """Database stats - users aur groups count"""
+    def segment_eta(self, size, messages=1):
+        """Current send rate par segment ko bhejne ka andaza"""
+        return format_duration(size * messages / self.rate_control.rate)
+
+    async def load_database_stats(self):
+        """Stats cache ka loader - counts aur unique total"""
         try:
-            users_count = self.anon_db.tgusersdb.count_documents({})
-            groups_count = self.anon_db.assistants.count_documents({})
-            chats_count = self.anon_db.chats.count_documents({})
+            if STATS_MODE == 'approx':
+                count = lambda collection: self.db.run(collection.estimated_document_count)
+            else:
+                count = lambda collection: self.db.run(collection.count_documents, {})
+            unique = self.count_segment()
             
-            total_unique = len(self.get_all_chats())
+            users_count, groups_count, chats_count, total_unique = await asyncio.gather(
+                count(self.anon_db.tgusersdb),
+                count(self.anon_db.assistants),
+                count(self.anon_db.chats),
+                unique
+            )
             
             return {
                 'users': users_count,
@@ -110,114 +2668,456 @@ class BroadcastSystem:
                 'total_unique': total_unique
             }
         except Exception as e:
-            print(f"Error getting database stats: {e}")
+            log.error('stats_load_failed', f"Error getting database stats: {e}")
+            return None
+
+    async def get_database_stats(self):
+        """Database stats - users aur groups count (cached)"""
+        db_stats = await self.stats_cache.get()
+        if db_stats is None:
             return {
                 'users': 0,
                 'groups': 0,
                 'chats': 0,
                 'total_unique': 0
             }
+        return dict(db_stats)
 
-    async def send_to_chat(self, chat_id, message: Message):
+    async def send_to_chat(self, chat_id, payload: BroadcastPayload):
         """Single chat ko message send karo"""
-        # Skip if failed 3+ times
-        if self.failed_chats.get(str(chat_id), 0) >= 3:
-            return False
-        
+        # Dead chats audience query me hi filter ho chuke hain
+        started = time.perf_counter()
+        message_id = None
         try:
-            # Message copy karo with all formatting
-            await message.copy(chat_id)
+            # Pehle se compiled payload - formatting, media aur buttons ke saath
+            message_id = sent_message_id(await payload.send(app, chat_id, self.peers))
             
             self.stats['total_sent'] += 1
             self.stats['current_broadcast'] += 1
+            self.rate_control.on_success()
             
             # Success par failed count reset karo
-            if str(chat_id) in self.failed_chats:
-                del self.failed_chats[str(chat_id)]
+            self.failed_chats.record_success(chat_id)
             
-            return True
+            result = SEND_OK
             
         except FloodWait as e:
+            # Sabhi senders ko rok do jab tak wait khatam na ho
             self.stats['flood_waits'] += 1
-            print(f"⏳ FloodWait: {e.value}s for chat {chat_id}")
-            await asyncio.sleep(e.value)
-            return False
+            SEND_ERRORS.inc(error='flood_wait')
+            FLOOD_WAIT_SECONDS.inc(e.value)
+            log.warning('flood_wait', f"⏳ FloodWait: {e.value}s for chat {chat_id}", chat_id=chat_id, seconds=e.value, sample=True)
+            self.gate.trip(e.value)
+            self.rate_control.on_flood(e.value)
+            result = SEND_RETRY
             
-        except (UserIsBlocked, ChatWriteForbidden):
+        except (UserIsBlocked, ChatWriteForbidden) as e:
+            # Blocked chat agli broadcasts ke audience se bahar
             self.stats['total_blocked'] += 1
-            self.failed_chats[str(chat_id)] = self.failed_chats.get(str(chat_id), 0) + 1
-            return False
+            SEND_ERRORS.inc(error='blocked' if isinstance(e, UserIsBlocked) else 'write_forbidden')
+            log.debug('send_blocked', chat_id=chat_id, error=type(e).__name__, sample=True)
+            self.failed_chats.record_failure(chat_id, dead=True)
+            result = SEND_BLOCKED
+            
+        except TEMPORARY_ERRORS as e:
+            SEND_ERRORS.inc(error='temporary')
+            log.debug('send_temporary_error', chat_id=chat_id, error=type(e).__name__, sample=True)
+            result = SEND_RETRY
             
         except Exception as e:
             self.stats['total_failed'] += 1
-            self.failed_chats[str(chat_id)] = self.failed_chats.get(str(chat_id), 0) + 1
-            return False
+            SEND_ERRORS.inc(error='other')
+            log.warning('send_failed', f"⚠️ Send failed for chat {chat_id}: {e}", chat_id=chat_id, error=type(e).__name__, sample=True)
+            self.failed_chats.record_failure(chat_id)
+            result = SEND_FAILED
+        
+        SEND_SECONDS.observe(time.perf_counter() - started, result=result)
+        return result, message_id
+
+    def queue_depth(self):
+        return sum(run['queue'].qsize() for run in self.scheduler.active.values() if 'queue' in run)
+
+    def retry_depth(self):
+        return sum(len(run['retries']) for run in self.scheduler.active.values() if 'retries' in run)
+
+    def finish_chat(self, run):
+        """Chat ka final result aa gaya - pending count ghatao"""
+        run['pending'] -= 1
+        if run['pending'] == 0 and run['fed']:
+            run['drained'].set()
+
+    def run_counters(self, run):
+        return {'done': run.get('done', 0), 'success': run.get('success', 0), 'failed': run.get('failed', 0)}
+
+    async def save_checkpoint(self, run):
+        try:
+            await self.jobs.checkpoint(run['job_id'], run['tracker'].checkpoint(), self.run_counters(run))
+        except Exception as e:
+            log.error('checkpoint_failed', f"Error saving checkpoint for job {run['job_id']}: {e}", job_id=run['job_id'])
+
+    async def checkpoint_loop(self, run):
+        """Har CHECKPOINT_INTERVAL par job ka progress save karo"""
+        while True:
+            await asyncio.sleep(CHECKPOINT_INTERVAL)
+            await self.save_checkpoint(run)
+
+    async def dispatch(self, queue, run, chat_ids):
+        """Chats ke peers bulk me warm karo, phir workers ko do"""
+        await self.peers.warm(chat_ids)
+        for chat_id in chat_ids:
+            run['pending'] += 1
+            run['tracker'].dispatched(chat_id)
+            await queue.put((chat_id, 0, 0))
+
+    async def broadcast_worker(self, queue, payloads, run):
+        """Queue se chats utha ke send karo - har chat ko saare messages order me"""
+        retries = run['retries']
+        tracker = run['tracker']
+        
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            
+            chat_id, attempt, index = item
+            message_ids = run['message_ids'].pop(chat_id, None) or [None] * len(payloads)
+            
+            # Job paused hai toh yahin ruko
+            await run['running'].wait()
+            
+            # Retry par wahin se jahan pichli baar ruka tha
+            result = SEND_OK
+            while index < len(payloads):
+                waited = time.perf_counter()
+                await self.limiter.acquire(chat_id)
+                LIMITER_WAIT_SECONDS.observe(time.perf_counter() - waited)
+                result, message_ids[index] = await self.send_to_chat(chat_id, payloads[index])
+                if result != SEND_OK:
+                    break
+                index += 1
+            
+            # Pehla attempt khatam - watermark aage badh sakta hai
+            if attempt == 0:
+                tracker.completed(chat_id)
+            
+            if result == SEND_RETRY:
+                # Backoff ke saath dobara try karo, attempts khatam toh is run me failed.
+                # FloodWait/outage global problem hai - FailureStore me count nahi hota,
+                # warna chat galti se permanently inactive ho jayega
+                if retries.push(chat_id, attempt, index=index):
+                    tracker.retrying[chat_id] = index
+                    run['message_ids'][chat_id] = message_ids
+                    self.stats['retried'] += 1
+                    continue
+                self.stats['total_failed'] += 1
+                result = SEND_FAILED
+            
+            tracker.retrying.pop(chat_id, None)
+            self.deliveries.record(run['job_id'], chat_id, result, message_ids)
+            run['done'] += 1
+            if result == SEND_OK:
+                run['success'] += 1
+            else:
+                run['failed'] += 1
+            self.finish_chat(run)
+
+    def run_errors(self, run):
+        """Is run ke errors ka breakdown (global stats ka diff)"""
+        base = run.get('stats_base', self.stats)
+        return {key: self.stats[key] - base[key] for key in ('total_blocked', 'total_failed', 'flood_waits', 'retried')}
+
+    def sample_rate(self, run):
+        """Throughput (msgs/s) - smoothed, har progress tick par"""
+        now = time.monotonic()
+        done = run.get('done', 0)
+        last_time, last_done = run.get('rate_sample', (now, done))
+        if now > last_time:
+            instant = (done - last_done) / (now - last_time)
+            run['rate'] = instant if 'rate' not in run else 0.7 * run['rate'] + 0.3 * instant
+        run['rate_sample'] = (now, done)
+
+    def progress_text(self, run):
+        """Job ka live status text - throughput, ETA aur errors ke saath"""
+        done = run.get('done', 0)
+        total = max(run.get('total', 0), done)
+        progress = (done / total * 100) if total else 0.0
+        state = "⏸️ Paused" if not run['running'].is_set() else "📤 Broadcasting..."
+        retries = run.get('retries')
+        rate = run.get('rate', 0.0)
+        eta = format_duration((total - done) / rate) if rate > 0 else "—"
+        errors = self.run_errors(run)
+        return (
+            f"{state}\n\n"
+            f"🆔 Job: `{run['job_id']}`\n"
+            f"📦 Messages: {run.get('messages', 1)}\n"
+            f"{self.segment_line(run.get('segment'))}"
+            f"Progress: {done}/{total} ({progress:.1f}%)\n"
+            f"⚡ Speed: {rate:.1f} msg/s | 🎚️ Limit: {self.rate_control.rate:.1f} msg/s | ⏱️ ETA: {eta}\n"
+            f"✅ Success: {run.get('success', 0)}\n"
+            f"❌ Failed: {run.get('failed', 0)}\n"
+            f"🚫 Blocked: {errors['total_blocked']} | ⚠️ Other: {errors['total_failed']}\n"
+            f"⏳ Flood Waits: {errors['flood_waits']} | 🔁 Retry Queue: {len(retries) if retries is not None else 0}"
+        )
+
+    @staticmethod
+    def segment_line(segment):
+        """Status texts me segment ki line - poori audience ho toh kuch nahi"""
+        if segment is None or segment_key(segment) == 'all':
+            return ""
+        return f"🎯 Segment: {segment_label(segment)}\n"
+
+    def render_progress(self, run):
+        self.sample_rate(run)
+        return self.progress_text(run)
 
-    async def start_broadcast(self, message: Message, status_msg: Message):
-        """Broadcast shuru karo"""
-        self.is_broadcasting = True
+    async def start_broadcast(self, messages, status_msg: Message, job, run):
+        """Broadcast chalao - job ke checkpoint se (naya job ho toh shuru se)"""
         self.stats['current_broadcast'] = 0
         
-        all_chats = self.get_all_chats()
-        total_chats = len(all_chats)
+        try:
+            # Startup ke core phases (indexes etc.) settle hone tak ruko
+            if not self.readiness.settled.is_set():
+                await ProgressReporter.post(status_msg, "⏳ Bot abhi start ho raha hai - DB ready hote hi broadcast shuru hoga...")
+                await self.readiness.settled.wait()
+            
+            await self.run_broadcast(messages, status_msg, job, run)
+        except Exception as e:
+            log.error('broadcast_failed', f"❌ Broadcast error: {e}", job_id=job['_id'])
+            await ProgressReporter.post(
+                status_msg,
+                f"❌ **Broadcast ruk gaya!**\n\n"
+                f"Error: {e}\n"
+                f"♻️ Bot restart hone par last checkpoint se resume hoga."
+            )
+
+    async def run_broadcast(self, messages, status_msg: Message, job, run):
+        # Failed chats index pehli broadcast par load hota hai
+        await self.failed_chats.load()
         
-        if total_chats == 0:
-            await status_msg.edit("❌ Koi chat nahi mili database me!")
-            self.is_broadcasting = False
-            return
+        checkpoint = job['checkpoint']
+        resumed = checkpoint['after'] is not None
+        counters = job['counters']
         
-        await status_msg.edit(f"🚀 Broadcast shuru ho gaya!\n\n📊 Total Chats: {total_chats}\n⏳ Please wait...")
+        await ProgressReporter.post(
+            status_msg,
+            f"🚀 Broadcast {'resume' if resumed else 'shuru'} ho gaya!\n\n"
+            f"🆔 Job: `{job['_id']}`\n"
+            f"📦 Messages: {len(messages)}\n"
+            f"⏳ Please wait..."
+        )
+        log.info(
+            'broadcast_started',
+            f"🚀 Broadcast job {job['_id']} {'resumed' if resumed else 'started'}",
+            job_id=job['_id'], messages=len(messages), resumed=resumed,
+            segment=None if 'audience' in job else segment_key(job_segment(job))
+        )
         
         start_time = time.time()
-        success = 0
-        failed = 0
+        run.update({
+            'total': await self.audience_size(job),
+            'done': counters['done'],
+            'success': counters['success'],
+            'failed': counters['failed'],
+            'pending': 0,
+            'fed': False,
+            'drained': asyncio.Event(),
+            'retries': RetryQueue(RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRY_MAX_ATTEMPTS),
+            'tracker': ProgressTracker(checkpoint['after']),
+            'message_ids': {},
+            'messages': len(messages),
+            'segment': None if 'audience' in job else job_segment(job),
+            'stats_base': dict(self.stats)
+        })
+        
+        # Messages ek baar compile - workers sirf raw requests bhejenge
+        payloads = [await BroadcastPayload.compile(app, message) for message in messages]
+        
+        # Session ke saved peers ek query me cache me
+        await self.peers.load()
+        
+        # Bounded pool of concurrent senders - ek shared limiter ke peeche.
+        # Har chat par saare messages ek worker bhejta hai (per-chat gap ke saath),
+        # isliye messages jitne zyada, utne workers.
+        worker_count = BROADCAST_WORKERS * len(payloads)
+        queue = run['queue'] = asyncio.Queue(maxsize=worker_count * 4)
+        workers = [
+            asyncio.create_task(self.broadcast_worker(queue, payloads, run))
+            for _ in range(worker_count)
+        ]
+        retry_feeder = asyncio.create_task(run['retries'].feed(queue))
+        checkpointer = asyncio.create_task(self.checkpoint_loop(run))
+        reporter = ProgressReporter(status_msg, functools.partial(self.render_progress, run), PROGRESS_INTERVAL)
+        reporter_task = asyncio.create_task(reporter.run())
         
-        for i, chat_id in enumerate(all_chats, 1):
-            result = await self.send_to_chat(chat_id, message)
+        try:
+            # Pichli run me retry queue me pade chats pehle (purane checkpoints me sirf chat ID)
+            resume_retry = dict(entry if isinstance(entry, list) else (entry, 0) for entry in checkpoint['retry'])
+            await self.peers.warm(resume_retry)
+            for chat_id, index in resume_retry.items():
+                run['pending'] += 1
+                run['tracker'].retrying[chat_id] = index
+                await queue.put((chat_id, 1, index))
             
-            if result:
-                success += 1
-            else:
-                failed += 1
+            # Audience stream hote hote hi workers ko feed karo - har batch ke peers pehle warm
+            streamed = 0
+            batch = []
+            async for chat_id in self.job_audience(job, after=checkpoint['after']):
+                if chat_id in resume_retry:
+                    continue
+                streamed += 1
+                batch.append(chat_id)
+                if len(batch) >= PEER_WARM_BATCH:
+                    await self.dispatch(queue, run, batch)
+                    batch = []
+            await self.dispatch(queue, run, batch)
+            run['total'] = run['done'] + run['pending']
             
-            # Rate limiting: 30 messages per second
-            if i % 30 == 0:
-                await asyncio.sleep(1)
+            # Retry queue drain hone tak wait karo, tabhi run complete hai
+            run['fed'] = True
+            if run['pending'] == 0:
+                run['drained'].set()
+            await run['drained'].wait()
             
-            # Progress update har 50 messages par
-            if i % 50 == 0:
-                progress = (i / total_chats) * 100
-                await status_msg.edit(
-                    f"📤 Broadcasting...\n\n"
-                    f"Progress: {i}/{total_chats} ({progress:.1f}%)\n"
-                    f"✅ Success: {success}\n"
-                    f"❌ Failed: {failed}"
-                )
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+            
+        except BaseException:
+            # Jitna ho chuka uska checkpoint - restart par wahin se resume
+            await self.save_checkpoint(run)
+            raise
+            
+        finally:
+            retry_feeder.cancel()
+            checkpointer.cancel()
+            reporter_task.cancel()
+            for worker in workers:
+                worker.cancel()
+            
+            # Baaki failed chats changes, naye peers aur delivery log flush karo
+            await self.failed_chats.close()
+            await self.peers.close()
+            await self.deliveries.close()
+        
+        total_chats = run['done']
+        await self.jobs.finish(job['_id'], 'done', self.run_counters(run))
+        log.info(
+            'broadcast_done',
+            f"✅ Broadcast job {job['_id']} done: {run['success']}/{total_chats} delivered",
+            job_id=job['_id'], seconds=round(time.time() - start_time, 3),
+            **self.run_counters(run), **self.run_errors(run)
+        )
+        
+        if total_chats == 0:
+            await ProgressReporter.post(status_msg, "❌ Koi chat nahi mili database me!")
+            return
+        
+        success = run['success']
+        failed = run['failed']
+        errors = self.run_errors(run)
         
-        # Save failed chats
-        self.save_failed_chats()
+        # Poori segment stream hua - exact unique count cache me daalo
+        if not resumed and 'audience' not in job:
+            self.segment_cache(job_segment(job)).update(total_unique=streamed)
         
         duration = time.time() - start_time
         
         # Final report
         report = (
             f"✅ **Broadcast Complete!**\n\n"
+            f"🆔 Job: `{job['_id']}`\n"
+            f"{self.segment_line(run['segment'])}"
             f"📊 **Statistics:**\n"
             f"• Total Chats: {total_chats}\n"
+            f"• 📦 Messages per chat: {len(payloads)}\n"
             f"• ✅ Delivered: {success}\n"
             f"• ❌ Failed: {failed}\n"
-            f"• 🚫 Blocked: {self.stats['total_blocked']}\n"
-            f"• ⏳ Flood Waits: {self.stats['flood_waits']}\n"
-            f"• ⏱️ Time Taken: {duration:.1f}s\n\n"
+            f"• 🚫 Blocked: {errors['total_blocked']}\n"
+            f"• ⚠️ Other Errors: {errors['total_failed']}\n"
+            f"• ⏳ Flood Waits: {errors['flood_waits']}\n"
+            f"• 🔁 Retried: {errors['retried']}\n"
+            f"• ⏱️ Time Taken: {format_duration(duration)}\n\n"
             f"Success Rate: {(success/total_chats*100):.1f}%"
         )
         
-        await status_msg.edit(report)
-        self.is_broadcasting = False
+        await ProgressReporter.post(status_msg, report)
+
+    async def shutdown(self):
+        """Shutdown par jobs ka checkpoint aur saare buffered writes flush karo"""
+        # Startup abhi chal raha ho toh pehle use roko - band hote waqt naye jobs resume na hon
+        task = self.readiness.task
+        if task and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.scheduler.shutdown()
+        await self.failed_chats.close()
+        await self.peers.close()
+        await self.deliveries.close()
+        log.info('shutdown', "👋 Jobs checkpointed, stores flushed")
+
+    async def job_status_message(self, job):
+        """Resume ke liye job ka purana status message lo, na mile toh naya bhejo"""
+        ref = job['status_message']
+        try:
+            status_msg = await app.get_messages(ref['chat_id'], ref['message_id'])
+            if status_msg and not status_msg.empty:
+                return status_msg
+        except Exception:
+            pass
+        return await app.send_message(ref['chat_id'], "⏳ Broadcast resume ho raha hai...")
+
+    async def load_job(self, job):
+        """Job ke source messages aur status message Telegram se lo"""
+        try:
+            messages = []
+            for source in job_sources(job):
+                message = await app.get_messages(source['chat_id'], source['message_id'])
+                if message is None or message.empty:
+                    raise ValueError("source message nahi mila")
+                messages.append(message)
+            status_msg = await self.job_status_message(job)
+        except Exception as e:
+            log.error('job_load_failed', f"❌ Job {job['_id']} ke messages load nahi hue: {e}", job_id=job['_id'])
+            return None
+        return messages, status_msg
+
+    async def resume_jobs(self):
+        """Startup par adhoore broadcast jobs last checkpoint se resume karo"""
+        try:
+            jobs = await self.jobs.unfinished()
+        except Exception as e:
+            log.error('jobs_load_failed', f"Error loading unfinished jobs: {e}")
+            return
+        
+        for job in jobs:
+            # Startup ke dauraan submit hua job pehle se chal raha hai
+            if job['_id'] in self.scheduler.active:
+                continue
+            loaded = await self.load_job(job)
+            if loaded is None:
+                await self.jobs.finish(job['_id'], 'failed', job['counters'])
+                continue
+            
+            log.info(
+                'job_resumed',
+                f"♻️ Resuming broadcast job {job['_id']} after chat {job['checkpoint']['after']}",
+                job_id=job['_id'], after=job['checkpoint']['after']
+            )
+            self.scheduler.start(*loaded, job)
+        
+        # Restart se pehle queue me pade broadcasts
+        await self.scheduler.dispatch()
 
 # Initialize broadcast system
 broadcast_system = BroadcastSystem()
 
+metrics.register(Gauge('broadcast_queue_depth', 'Workers ki queue me pade chats', broadcast_system.queue_depth))
+metrics.register(Gauge('broadcast_retry_queue_depth', 'Retry queue me pade chats', broadcast_system.retry_depth))
+metrics.register(Gauge('broadcast_send_rate', 'AIMD send rate limit (msg/s)', lambda: broadcast_system.rate_control.rate))
+metrics.register(Gauge('broadcast_active_jobs', 'Chal rahe broadcast jobs', lambda: len(broadcast_system.scheduler.active)))
+metrics.register(Gauge('broadcast_audience_snapshot_chats', 'Audience snapshot me chats', lambda: len(broadcast_system.snapshot)))
+metrics.register(Gauge('bot_ready', 'Startup ke core phases ok (1) ya nahi (0)', lambda: int(broadcast_system.readiness.ready)))
+
 # Command: /start
 @app.on_message(filters.command("start") & filters.private)
 async def start_command(client, message: Message):
@@ -256,24 +3156,38 @@ async def stats_command(client, message: Message):
     
     status_msg = await message.reply("⏳ Fetching statistics...")
     
-    db_stats = broadcast_system.get_database_stats()
+    db_stats, _ = await asyncio.gather(
+        broadcast_system.get_database_stats(),
+        broadcast_system.failed_chats.load()
+    )
     
     stats_text = (
         "📊 **Database Statistics**\n\n"
         f"👥 **Users:** {db_stats['users']}\n"
         f"👥 **Groups:** {db_stats['groups']}\n"
         f"💬 **Other Chats:** {db_stats['chats']}\n"
-        f"🔢 **Total Unique:** {db_stats['total_unique']}\n\n"
+        f"🔢 **Total Unique:** {db_stats['total_unique']}{' (approx)' if STATS_MODE == 'approx' else ''}\n"
+        f"🕒 **Updated:** {broadcast_system.stats_cache.age:.0f}s ago\n\n"
         f"📈 **Broadcast Stats:**\n"
         f"✅ Total Sent: {broadcast_system.stats['total_sent']}\n"
         f"❌ Total Failed: {broadcast_system.stats['total_failed']}\n"
         f"🚫 Blocked Users: {broadcast_system.stats['total_blocked']}\n"
-        f"⏳ Flood Waits: {broadcast_system.stats['flood_waits']}\n\n"
+        f"⏳ Flood Waits: {broadcast_system.stats['flood_waits']}\n"
+        f"🎚️ Send Rate: {broadcast_system.rate_control.rate:.1f}/{BROADCAST_RATE_CEILING:.0f} msg/s\n\n"
         f"🗑️ Failed Chats in DB: {len(broadcast_system.failed_chats)}"
     )
     
     await status_msg.edit(stats_text)
 
+def snapshot_status():
+    snapshot = broadcast_system.snapshot
+    if not snapshot.enabled:
+        return "off"
+    if snapshot.view is None:
+        return "building..."
+    delta = f", delta +{len(snapshot.added)}/-{len(snapshot.deleted)}" if snapshot.added or snapshot.deleted else ''
+    return f"{len(snapshot)} chats (built {format_duration(snapshot.age)} ago{delta}{', stale' if snapshot.needs_rebuild() else ''})"
+
 # Command: /broadcast_stats
 @app.on_message(filters.command("broadcast_stats"))
 async def broadcast_stats_command(client, message: Message):
@@ -283,6 +3197,8 @@ async def broadcast_stats_command(client, message: Message):
         await message.reply("❌ Only admins can use this command!")
         return
     
+    await broadcast_system.failed_chats.load()
+    
     stats_text = (
         "📊 **Broadcast Statistics**\n\n"
         f"✅ Total Sent: {broadcast_system.stats['total_sent']}\n"
@@ -290,7 +3206,9 @@ async def broadcast_stats_command(client, message: Message):
         f"🚫 Blocked Users: {broadcast_system.stats['total_blocked']}\n"
         f"⏳ Flood Waits: {broadcast_system.stats['flood_waits']}\n\n"
         f"🔄 Broadcasting: {'Yes ⚡' if broadcast_system.is_broadcasting else 'No 💤'}\n"
-        f"🗑️ Failed Chats: {len(broadcast_system.failed_chats)}"
+        f"🗑️ Failed Chats: {len(broadcast_system.failed_chats)}\n"
+        f"🧭 Peer Cache: {len(broadcast_system.peers)} ({broadcast_system.peers.hit_rate:.1f}% hits)\n"
+        f"🗂️ Audience Snapshot: {snapshot_status()}"
     )
     
     await message.reply(stats_text)
@@ -304,12 +3222,315 @@ async def clear_failed_command(client, message: Message):
         await message.reply("❌ Only admins can use this command!")
         return
     
-    count = len(broadcast_system.failed_chats)
-    broadcast_system.failed_chats = {}
-    broadcast_system.save_failed_chats()
+    await broadcast_system.failed_chats.load()
+    count = await broadcast_system.failed_chats.clear()
+    # Dead chats wapas audience me - snapshot dobara banega
+    broadcast_system.snapshot.invalidate()
     
     await message.reply(f"✅ {count} failed chats cleared!")
 
+# Job control commands: /jobs, /job, /pause, /resume, /cancel
+def command_job_id(message: Message):
+    """Command ka pehla argument job ID hai (optional)"""
+    return message.command[1] if len(message.command) > 1 else None
+
+@app.on_message(filters.command("jobs"))
+async def jobs_command(client, message: Message):
+    user_id = message.from_user.id
+    
+    if user_id not in ADMIN_IDS:
+        await message.reply("❌ Only admins can use this command!")
+        return
+    
+    lines = ["📋 **Broadcast Jobs**\n"]
+    
+    scheduler = broadcast_system.scheduler
+    for job_id, run in scheduler.active.items():
+        state = "⏸️" if not run['running'].is_set() else "⚡"
+        lines.append(f"{state} `{job_id}` - {run.get('done', 0)}/{max(run.get('total', 0), run.get('done', 0))}")
+    
+    try:
+        recent = await broadcast_system.jobs.recent()
+    except Exception as e:
+        log.error('jobs_fetch_failed', f"Error fetching jobs: {e}")
+        recent = []
+    
+    for job in recent:
+        if job['_id'] not in scheduler.active:
+            lines.append(f"• `{job['_id']}` - {job['status']} ({job['counters']['success']} sent)")
+    
+    if len(lines) == 1:
+        lines.append("Koi job nahi hai 💤")
+    
+    await message.reply("\n".join(lines))
+
+@app.on_message(filters.command("job"))
+async def job_command(client, message: Message):
+    user_id = message.from_user.id
+    
+    if user_id not in ADMIN_IDS:
+        await message.reply("❌ Only admins can use this command!")
+        return
+    
+    job_id = command_job_id(message)
+    run = broadcast_system.scheduler.find(job_id)
+    if run is not None:
+        await message.reply(broadcast_system.progress_text(run))
+        return
+    
+    job = await broadcast_system.jobs.get(job_id) if job_id else None
+    if job is None:
+        await message.reply("⚠️ Job nahi mila! Usage: /job <job_id>")
+        return
+    
+    if job['status'] == 'merged':
+        await message.reply(f"🆔 Job: `{job['_id']}`\n📦 Job `{job['merged_into']}` ke saath bheja gaya")
+        return
+    
+    await message.reply(
+        f"🆔 Job: `{job['_id']}`\n"
+        f"📌 Status: {job['status']}\n"
+        f"📦 Messages: {len(job_sources(job))}\n"
+        f"{broadcast_system.segment_line(None if 'audience' in job else job_segment(job))}"
+        f"✅ Success: {job['counters']['success']}\n"
+        f"❌ Failed: {job['counters']['failed']}"
+    )
+
+@app.on_message(filters.command(["pause", "resume", "cancel"]))
+async def job_control_command(client, message: Message):
+    user_id = message.from_user.id
+    
+    if user_id not in ADMIN_IDS:
+        await message.reply("❌ Only admins can use this command!")
+        return
+    
+    action = message.command[0].lower()
+    scheduler = broadcast_system.scheduler
+    job_id = getattr(scheduler, action)(command_job_id(message))
+    
+    # Queue me pada job shuru hone se pehle hi hat jata hai
+    if job_id is None and action == 'cancel' and command_job_id(message):
+        if await scheduler.unqueue(command_job_id(message)):
+            await message.reply(f"🗑️ Queued job `{command_job_id(message)}` hata diya!")
+            return
+    
+    if job_id is None:
+        await message.reply(f"⚠️ Active job nahi mila! Usage: /{action} <job_id>")
+        return
+    
+    replies = {
+        'pause': "⏸️ Job `{}` paused!",
+        'resume': "▶️ Job `{}` resumed!",
+        'cancel': "🛑 Job `{}` cancel ho raha hai..."
+    }
+    await message.reply(replies[action].format(job_id))
+
+# /resend modes - delivery log ke kaunse results dobara bhejne hain
+RESEND_STATUSES = {
+    'failed': [SEND_FAILED],
+    'blocked': [SEND_BLOCKED],
+    'all': [SEND_FAILED, SEND_BLOCKED],
+}
+
+@app.on_message(filters.command("resend"))
+async def resend_command(client, message: Message):
+    user_id = message.from_user.id
+    
+    if user_id not in ADMIN_IDS:
+        await message.reply("❌ Only admins can use this command!")
+        return
+    
+    usage = "⚠️ Usage: /resend <job_id> [failed|blocked|all|missed]"
+    job_id = command_job_id(message)
+    mode = message.command[2].lower() if len(message.command) > 2 else 'failed'
+    if job_id is None or (mode not in RESEND_STATUSES and mode != 'missed'):
+        await message.reply(usage)
+        return
+    
+    job = await broadcast_system.jobs.get(job_id)
+    if job is None:
+        await message.reply("⚠️ Job nahi mila!")
+        return
+    if job_id in broadcast_system.scheduler.active:
+        await message.reply("⚠️ Ye job abhi chal raha hai!")
+        return
+    
+    options = {}
+    if mode == 'missed':
+        # Ruke hue job ke checkpoint se - jo chats tab tak nahi pahunche
+        if job['status'] not in ('cancelled', 'failed'):
+            await message.reply("⚠️ Sirf cancelled/failed jobs ke missed chats bheje ja sakte hain")
+            return
+        options['checkpoint'] = job['checkpoint']
+        if 'audience' in job:
+            options['audience'] = job['audience']
+        # Segment wale job ke missed chats bhi usi segment se
+        options['segment'] = job.get('segment')
+    else:
+        if not DELIVERY_LOG:
+            await message.reply("⚠️ Delivery log band hai! `DELIVERY_LOG=true` set karo")
+            return
+        statuses = RESEND_STATUSES[mode]
+        if not await broadcast_system.deliveries.count(job_id, statuses):
+            await message.reply(f"✅ Job `{job_id}` me koi {mode} chat nahi hai")
+            return
+        options['audience'] = {'job_id': job_id, 'statuses': statuses}
+    
+    try:
+        source_msgs = []
+        for source in job_sources(job):
+            source_msg = await app.get_messages(source['chat_id'], source['message_id'])
+            if source_msg is None or source_msg.empty:
+                raise ValueError("source message nahi mila")
+            source_msgs.append(source_msg)
+    except Exception as e:
+        await message.reply(f"❌ Job ka message nahi mila: {e}")
+        return
+    
+    status_msg = await message.reply(f"⏳ Job `{job_id}` ke {mode} chats ko resend ho raha hai...")
+    await broadcast_system.scheduler.submit(source_msgs, status_msg, **options)
+
+def perf_text():
+    """Hot path ka breakdown - latency, waits, errors aur time split"""
+    send_counts, send_sum, sends = SEND_SECONDS.merged()
+    wait_counts, wait_sum, waits = LIMITER_WAIT_SECONDS.merged()
+    _, scan_sum, scans = SCAN_WAIT_SECONDS.merged()
+    _, db_sum, db_ops = DB_OP_SECONDS.merged()
+    errors = {key[0]: value for key, value in SEND_ERRORS.values.items()}
+    split_total = send_sum + wait_sum + scan_sum
+    
+    def share(value):
+        return f"{value / split_total * 100:.0f}%" if split_total else "—"
+    
+    return (
+        "⚙️ **Broadcast Performance**\n\n"
+        f"📤 Send latency: p50 {SEND_SECONDS.quantile(0.5, send_counts) * 1000:.0f} ms | "
+        f"p99 {SEND_SECONDS.quantile(0.99, send_counts) * 1000:.0f} ms ({sends} sends)\n"
+        f"🎚️ Limiter wait: avg {(wait_sum / waits if waits else 0) * 1000:.0f} ms | "
+        f"p99 {LIMITER_WAIT_SECONDS.quantile(0.99, wait_counts) * 1000:.0f} ms\n"
+        f"🗄️ Mongo scan wait: {scan_sum:.1f}s ({scans} batches)\n"
+        f"💾 DB calls: {db_ops} ({db_sum:.1f}s)\n"
+        f"📥 Queue: {broadcast_system.queue_depth()} | 🔁 Retry: {broadcast_system.retry_depth()}\n"
+        f"⚡ Send rate: {broadcast_system.rate_control.rate:.1f} msg/s\n\n"
+        f"❌ **Errors:**\n"
+        f"• FloodWait: {errors.get('flood_wait', 0)} ({FLOOD_WAIT_SECONDS.total():.0f}s)\n"
+        f"• Blocked: {errors.get('blocked', 0)} | Write forbidden: {errors.get('write_forbidden', 0)}\n"
+        f"• Temporary: {errors.get('temporary', 0)} | Other: {errors.get('other', 0)}\n\n"
+        f"⏱️ **Time split:** send {share(send_sum)} | limiter {share(wait_sum)} | scan {share(scan_sum)}"
+    )
+
+# Command: /perf
+@app.on_message(filters.command("perf"))
+async def perf_command(client, message: Message):
+    user_id = message.from_user.id
+    
+    if user_id not in ADMIN_IDS:
+        await message.reply("❌ Only admins can use this command!")
+        return
+    
+    await message.reply(perf_text())
+
+def profile_text(report):
+    """Profile ka summary - loop lag, sabse bhaari callbacks aur busy stacks"""
+    stacks = report['stacks']
+    samples = sum(stacks.values())
+    busy = {stack: count for stack, count in stacks.items() if not profiler.is_idle(stack)}
+    busy_samples = sum(busy.values())
+    lags = report['lags']
+    
+    lines = [
+        "🔬 **Profile Report**\n",
+        f"⏱️ Duration: {report['seconds']:.1f}s | Samples: {samples} "
+        f"(busy {busy_samples / samples * 100 if samples else 0:.0f}%)",
+        f"🐌 Loop lag: p50 {percentile(lags, 0.5) * 1000:.1f} ms | "
+        f"p99 {percentile(lags, 0.99) * 1000:.1f} ms | max {(lags[-1] if lags else 0) * 1000:.1f} ms",
+        "",
+        "🧩 **Top callbacks (total time):**"
+    ]
+    top_callbacks = sorted(report['callbacks'].items(), key=lambda item: -item[1][1])[:5]
+    for name, (calls, total, longest) in top_callbacks:
+        lines.append(f"• `{name}` - {total * 1000:.0f} ms / {calls} calls (max {longest * 1000:.1f} ms)")
+    
+    lines += ["", "🔥 **Top stacks (busy):**"]
+    for stack, count in sorted(busy.items(), key=lambda item: -item[1])[:8]:
+        # Leaf ke paas ke frames hi kaam ke hain
+        frames = stack.split(';')[-3:]
+        lines.append(f"• {count / samples * 100:.1f}% `{' ← '.join(reversed(frames))}`")
+    if not busy:
+        lines.append("• Loop zyadatar idle tha 💤")
+    return "\n".join(lines)
+
+# Command: /profile [seconds]
+@app.on_message(filters.command("profile"))
+async def profile_command(client, message: Message):
+    user_id = message.from_user.id
+    
+    if user_id not in ADMIN_IDS:
+        await message.reply("❌ Only admins can use this command!")
+        return
+    
+    if profiler.running:
+        await message.reply("⚠️ Ek profile already chal raha hai!")
+        return
+    
+    try:
+        seconds = float(message.command[1]) if len(message.command) > 1 else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        await message.reply("⚠️ Usage: /profile [seconds]")
+        return
+    seconds = min(max(seconds, 1), PROFILE_MAX_SECONDS)
+    
+    status_msg = await message.reply(f"🔬 {seconds:.0f}s ke liye profiling ho rahi hai...")
+    report = await profiler.run(seconds)
+    log.info(
+        'profile_done', f"🔬 Profile done: {sum(report['stacks'].values())} samples",
+        seconds=round(report['seconds'], 2), samples=sum(report['stacks'].values()),
+        lag_p99=percentile(report['lags'], 0.99)
+    )
+    await status_msg.edit(profile_text(report))
+    
+    # Flamegraph ke liye folded stacks - flamegraph.pl / speedscope me kholo
+    path = os.path.join(tempfile.gettempdir(), f"profile-{int(time.time())}.folded")
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, LoopProfiler.write_folded, path, report['stacks'])
+        await message.reply_document(path, caption="🔥 Folded stacks - flamegraph.pl ya speedscope me kholo")
+    except Exception as e:
+        log.error('profile_upload_failed', f"Error sending profile: {e}")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+def ready_text():
+    """Startup phases ka status - state aur timing ke saath"""
+    readiness = broadcast_system.readiness
+    if readiness.ready:
+        state = "✅ Ready"
+    elif readiness.settled.is_set():
+        state = "⚠️ Degraded"
+    else:
+        state = "⏳ Starting"
+    
+    icons = {'pending': "⏸️", 'running': "⏳", 'ok': "✅", 'failed': "❌"}
+    lines = [f"🚦 **Readiness: {state}**\n"]
+    for name, phase in readiness.phases.items():
+        timing = f" - {phase['seconds'] * 1000:.0f} ms" if phase['seconds'] is not None else ""
+        error = f" ({phase['error']})" if phase['error'] else ""
+        lines.append(f"{icons[phase['state']]} {name}{timing}{error}")
+    lines.append(f"\n⏱️ Uptime: {format_duration(readiness.elapsed)}")
+    return "\n".join(lines)
+
+# Command: /ready
+@app.on_message(filters.command("ready"))
+async def ready_command(client, message: Message):
+    user_id = message.from_user.id
+    
+    if user_id not in ADMIN_IDS:
+        await message.reply("❌ Only admins can use this command!")
+        return
+    
+    await message.reply(ready_text())
+
 # Command: /help
 @app.on_message(filters.command("help"))
 async def help_command(client, message: Message):
@@ -324,13 +3545,21 @@ async def help_command(client, message: Message):
         "🎯 **Broadcast Kaise Kare:**\n"
         "1. Bot ko private message karo\n"
         "2. Koi bhi message bhejo (text/photo/video)\n"
-        "3. `yes` type karke confirm karo\n"
+        "3. Segment chuno (sabhi / users / groups) - count aur ETA dikhega\n"
         "4. Done! 🚀\n\n"
         "📊 **Available Commands:**\n"
         "• /start - Bot info\n"
         "• /stats - Database statistics\n"
         "• /broadcast_stats - Broadcast stats\n"
         "• /clear_failed - Failed chats clear\n"
+        "• /jobs - Broadcast jobs list\n"
+        "• /job <id> - Job ka live status\n"
+        "• /pause, /resume, /cancel <id> - Job control\n"
+        "• /perf - Send latency, waits aur errors\n"
+        "• /profile [seconds] - Live profile aur flamegraph file\n"
+        "• /ready - Startup phases aur readiness\n"
+        "• /resend <id> [failed|blocked|all|missed] - Job ke failed chats ko dobara\n"
+        "• /broadcast [users|groups] [since=YYYY-MM-DD] - Reply karke segment ko bhejo\n"
         "• /banall - Ban all members in all groups\n"
         "• /help - Ye message\n\n"
         "💡 **Tips:**\n"
@@ -371,7 +3600,7 @@ class BanallSystem:
             return True, "has_rights"
             
         except Exception as e:
-            print(f"Error checking rights in {chat_id}: {e}")
+            log.warning('banall_rights_check_failed', f"Error checking rights in {chat_id}: {e}", chat_id=chat_id, sample=True)
             return False, "error"
     
     async def ban_member(self, chat_id, user_id):
@@ -397,21 +3626,28 @@ class BanallSystem:
         
         if not has_rights:
             self.ban_stats['no_rights'] += 1
-            print(f"❌ No ban rights in {chat_id}: {reason}")
+            log.info('banall_no_rights', f"❌ No ban rights in {chat_id}: {reason}", chat_id=chat_id, sample=True)
             
             # Leave group
             try:
                 await app.leave_chat(chat_id)
                 self.ban_stats['groups_left'] += 1
-                print(f"✅ Left group: {chat_id}")
+                log.info('banall_left', f"✅ Left group: {chat_id}", chat_id=chat_id)
                 
                 # Remove from MongoDB
-                broadcast_system.anon_db.assistants.delete_one({'chat_id': chat_id})
-                broadcast_system.anon_db.chats.delete_one({'chat_id': chat_id})
+                db = broadcast_system.db
+                stats_cache = broadcast_system.stats_cache
+                removed_assistants = await db.run(broadcast_system.anon_db.assistants.delete_one, {'chat_id': chat_id})
+                removed_chats = await db.run(broadcast_system.anon_db.chats.delete_one, {'chat_id': chat_id})
+                stats_cache.adjust('groups', -removed_assistants.deleted_count)
+                stats_cache.adjust('chats', -removed_chats.deleted_count)
+                if removed_assistants.deleted_count or removed_chats.deleted_count:
+                    stats_cache.adjust('total_unique', -1)
+                    broadcast_system.snapshot.discard([chat_id])
                 self.ban_stats['groups_removed_from_db'] += 1
                 
             except Exception as e:
-                print(f"❌ Could not leave group {chat_id}: {e}")
+                log.warning('banall_leave_failed', f"❌ Could not leave group {chat_id}: {e}", chat_id=chat_id)
             
             return
         
@@ -428,7 +3664,7 @@ class BanallSystem:
             except:
                 chat_title = str(chat_id)
             
-            print(f"\n🔨 Starting banall in: {chat_title}")
+            log.info('banall_group_start', f"🔨 Starting banall in: {chat_title}", chat_id=chat_id)
             
             async for member in app.get_chat_members(chat_id):
                 member_count += 1
@@ -455,7 +3691,7 @@ class BanallSystem:
                 results = await asyncio.gather(*tasks, return_exceptions=True)
                 banned_count += sum(1 for r in results if r is True)
             
-            print(f"✅ Banned {banned_count}/{member_count} members in {chat_title}")
+            log.info('banall_group_done', f"✅ Banned {banned_count}/{member_count} members in {chat_title}", chat_id=chat_id, banned=banned_count, members=member_count)
             
             self.ban_stats['groups_banned'] += 1
             self.ban_stats['total_banned'] += banned_count
@@ -465,12 +3701,24 @@ class BanallSystem:
             try:
                 await app.leave_chat(chat_id)
                 self.ban_stats['groups_left'] += 1
-                print(f"✅ Left group: {chat_title}")
+                log.info('banall_left', f"✅ Left group: {chat_title}", chat_id=chat_id)
             except Exception as e:
-                print(f"❌ Could not leave: {e}")
+                log.warning('banall_leave_failed', f"❌ Could not leave: {e}", chat_id=chat_id)
             
         except Exception as e:
-            print(f"❌ Error in banall for {chat_id}: {e}")
+            log.error('banall_group_failed', f"❌ Error in banall for {chat_id}: {e}", chat_id=chat_id)
+    
+    def fetch_groups(self):
+        """MongoDB se sabhi groups lo (thread me chalta hai)"""
+        all_groups = []
+        
+        # Negative IDs are groups - range index se hi filter ho jata hai
+        for collection in ('assistants', 'chats'):
+            with broadcast_system.scan_cursor(collection, 'chat_id', {'kind': 'groups', 'since': None}) as cursor:
+                for group in cursor:
+                    all_groups.append(group['chat_id'])
+        
+        return all_groups
     
     async def start_banall(self, status_msg):
         """Start banall in all groups"""
@@ -478,15 +3726,9 @@ class BanallSystem:
         all_groups = []
         
         try:
-            for group in broadcast_system.anon_db.assistants.find({}, {'chat_id': 1}):
-                if 'chat_id' in group and group['chat_id'] < 0:  # Negative IDs are groups
-                    all_groups.append(group['chat_id'])
-            
-            for chat in broadcast_system.anon_db.chats.find({}, {'chat_id': 1}):
-                if 'chat_id' in chat and chat['chat_id'] < 0:
-                    all_groups.append(chat['chat_id'])
+            all_groups = await broadcast_system.db.run(self.fetch_groups)
         except Exception as e:
-            print(f"Error fetching groups: {e}")
+            log.error('banall_groups_fetch_failed', f"Error fetching groups: {e}")
         
         # Remove duplicates
         all_groups = list(set(all_groups))
@@ -506,9 +3748,7 @@ class BanallSystem:
         
         # Process each group
         for i, group_id in enumerate(all_groups, 1):
-            print(f"\n{'='*50}")
-            print(f"Processing group {i}/{len(all_groups)}: {group_id}")
-            print(f"{'='*50}")
+            log.info('banall_group', f"Processing group {i}/{len(all_groups)}: {group_id}", chat_id=group_id, index=i, total=len(all_groups))
             
             await self.ban_all_in_group(group_id, status_msg)
             
@@ -578,23 +3818,25 @@ async def callback_handler(client, callback_query):
         await callback_query.answer("❌ Only admins can use this!", show_alert=True)
         return
     
-    # Broadcast confirmation
+    # Broadcast confirmation - har message ka apna pending entry, button me segment
     if data.startswith("broadcast_yes_"):
-        if user_id not in pending_broadcasts:
+        _, _, kind, message_id = data.split("_")
+        key = (user_id, int(message_id))
+        if key not in pending_broadcasts:
             await callback_query.answer("❌ Message expired!", show_alert=True)
             return
         
         await callback_query.message.delete()
         
-        message_to_broadcast = pending_broadcasts[user_id]
-        del pending_broadcasts[user_id]
+        message_to_broadcast, since = pending_broadcasts.pop(key)
+        segment = {'kind': kind, 'since': since}
         
-        status_msg = await callback_query.message.reply("⏳ Broadcast start ho raha hai...")
-        await broadcast_system.start_broadcast(message_to_broadcast, status_msg)
+        status_msg = await callback_query.message.reply(f"⏳ Broadcast start ho raha hai... ({segment_label(segment)})")
+        job_id = await broadcast_system.scheduler.submit([message_to_broadcast], status_msg, segment=segment)
+        await callback_query.answer(f"🚀 Job {job_id} submitted!")
     
     elif data.startswith("broadcast_no_"):
-        if user_id in pending_broadcasts:
-            del pending_broadcasts[user_id]
+        pending_broadcasts.pop((user_id, int(data.rsplit("_", 1)[1])), None)
         await callback_query.message.edit("❌ Broadcast cancelled!")
         await callback_query.answer("Cancelled!")
     
@@ -620,73 +3862,126 @@ async def callback_handler(client, callback_query):
 pending_broadcasts = {}
 pending_banall = {}
 
-# Broadcast handler - Koi bhi message forward karo
-@app.on_message(filters.private & ~filters.command(["start", "stats", "broadcast_stats", "clear_failed", "help", "banall"]))
-async def broadcast_handler(client, message: Message):
-    user_id = message.from_user.id
-    
-    # Check if admin
-    if user_id not in ADMIN_IDS:
-        await message.reply("❌ Only admins can broadcast messages!")
-        return
+async def confirm_broadcast(message: Message, user_id, since=None, kinds=SEGMENT_KINDS):
+    """Confirmation prompt - har segment ka button, cached size aur ETA ke saath"""
+    pending_broadcasts[(user_id, message.id)] = (message, since)
     
-    # Check if already broadcasting
-    if broadcast_system.is_broadcasting:
-        await message.reply("⚠️ Ek broadcast already chal raha hai! Please wait...")
-        return
+    segments = [{'kind': kind, 'since': since} for kind in kinds]
+    sizes = await asyncio.gather(*(broadcast_system.segment_size(segment) for segment in segments))
     
-    # Store message for confirmation
-    pending_broadcasts[user_id] = message
+    lines = []
+    buttons = []
+    for segment, size in zip(segments, sizes):
+        lines.append(f"{segment_label(segment)}: {size} chats • ⏱️ ~{broadcast_system.segment_eta(size)}")
+        buttons.append([InlineKeyboardButton(
+            f"✅ {segment_label(segment)} ({size})",
+            callback_data=f"broadcast_yes_{segment['kind']}_{message.id}"
+        )])
+    buttons.append([InlineKeyboardButton("❌ Cancel", callback_data=f"broadcast_no_{message.id}")])
     
-    # Confirm broadcast with inline buttons
-    keyboard = InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("✅ Yes, Broadcast", callback_data=f"broadcast_yes_{message.id}"),
-            InlineKeyboardButton("❌ Cancel", callback_data=f"broadcast_no_{message.id}")
-        ]
-    ])
+    # Broadcast chal raha ho toh ye queue me jayega
+    queue_note = (
+        "📥 Ek broadcast abhi chal raha hai - ye queue me jayega aur baaki queued messages ke saath jayega.\n\n"
+        if broadcast_system.scheduler.broadcasting() else ""
+    )
     
     await message.reply(
         "🔄 **Ready to Broadcast!**\n\n"
-        "⚡ Is message ko sabhi users aur groups me bhejne ke liye confirm karo.\n\n"
+        "🎯 Kise bhejna hai chuno:\n"
+        + "\n".join(lines) + "\n\n"
+        f"{queue_note}"
         "Click button to confirm:",
-        reply_markup=keyboard
+        reply_markup=InlineKeyboardMarkup(buttons)
     )
 
-# Group me message handler - Admin group me message bheje toh broadcast
-@app.on_message(filters.group & filters.command("broadcast"))
-async def group_broadcast_handler(client, message: Message):
+# Broadcast handler - Koi bhi message forward karo
+@app.on_message(filters.private & ~filters.command(["start", "stats", "broadcast_stats", "clear_failed", "help", "banall", "jobs", "job", "pause", "resume", "cancel", "perf", "resend", "broadcast", "profile", "ready"]))
+async def broadcast_handler(client, message: Message):
     user_id = message.from_user.id
     
     # Check if admin
     if user_id not in ADMIN_IDS:
+        await message.reply("❌ Only admins can broadcast messages!")
         return
     
-    # Check if already broadcasting
-    if broadcast_system.is_broadcasting:
-        await message.reply("⚠️ Ek broadcast already chal raha hai!")
+    await confirm_broadcast(message, user_id)
+
+# /broadcast [users|groups] [since=YYYY-MM-DD|since=30d] - kisi message ko reply karke
+# Group me turant shuru hota hai, private me segment ke saath confirmation aata hai
+@app.on_message(filters.command("broadcast"))
+async def group_broadcast_handler(client, message: Message):
+    user_id = message.from_user.id
+    
+    # Check if admin
+    if user_id not in ADMIN_IDS:
         return
     
     # Get message to broadcast (replied message)
-    if message.reply_to_message:
-        broadcast_msg = message.reply_to_message
-        status_msg = await message.reply("⏳ Broadcast start ho raha hai...")
-        
-        # Start broadcast
-        await broadcast_system.start_broadcast(broadcast_msg, status_msg)
-    else:
+    if not message.reply_to_message:
         await message.reply("⚠️ Kisi message ko reply karke /broadcast use karo")
+        return
+    
+    try:
+        segment = parse_segment(message.command[1:])
+    except ValueError:
+        await message.reply("⚠️ Usage: /broadcast [users|groups] [since=YYYY-MM-DD|since=30d]")
+        return
+    
+    broadcast_msg = message.reply_to_message
+    if message.chat.type == ChatType.PRIVATE:
+        # Kind diya ho toh wahi button, warna teeno (since ke saath)
+        chosen = any(arg.lower() in SEGMENT_KINDS for arg in message.command[1:])
+        kinds = (segment['kind'],) if chosen else SEGMENT_KINDS
+        await confirm_broadcast(broadcast_msg, user_id, segment['since'], kinds)
+        return
+    
+    size = await broadcast_system.segment_size(segment)
+    status_msg = await message.reply(
+        f"⏳ Broadcast start ho raha hai...\n\n"
+        f"🎯 {segment_label(segment)}: {size} chats • ⏱️ ~{broadcast_system.segment_eta(size)}"
+    )
+    
+    # Start broadcast - background job (ya queue), handler turant free
+    await broadcast_system.scheduler.submit([broadcast_msg], status_msg, segment=segment)
 
-print("=" * 50)
-print("✅ Bot successfully started!")
-print("=" * 50)
-print(f"👤 Admin IDs: {ADMIN_IDS}")
-print(f"📊 MongoDB Connected: {MONGO_URL[:30]}...")
-print(f"🤖 Bot Token: {BOT_TOKEN[:20]}...")
-print("=" * 50)
-print("📡 Bot is now running and listening...")
-print("Press Ctrl+C to stop")
-print("=" * 50)
+async def main():
+    readiness = broadcast_system.readiness
+    readiness.record('setup', time.perf_counter() - BOOT_STARTED)
+    
+    started = time.perf_counter()
+    await app.start()
+    readiness.record('telegram', time.perf_counter() - started)
+    
+    # Local metrics endpoint - Prometheus yahin se scrape kare
+    if METRICS_PORT:
+        try:
+            await metrics.serve(METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            log.error('metrics_failed', f"❌ Metrics endpoint start nahi hua: {e}")
+    
+    # Mongo, indexes, failed chats, jobs resume aur snapshot background me -
+    # handlers abhi se serve karte hain, /ready par state dikhti hai
+    broadcast_system.readiness.task = asyncio.create_task(broadcast_system.start_services())
+    
+    await idle()
+    
+    # Deploy/SIGTERM - client band hone se pehle checkpoints aur flush
+    await broadcast_system.shutdown()
+    await app.stop()
 
 # Run bot
-app.run()
+if __name__ == "__main__":
+    print("=" * 50)
+    print("🚀 Bot starting...")
+    print("=" * 50)
+    print(f"👤 Admin IDs: {ADMIN_IDS}")
+    print(f"📊 MongoDB: {MONGO_URL[:30]}... (connection aur indexes background me check honge)")
+    print(f"📖 Scan Read Preference: {MONGO_READ_PREFERENCE}")
+    print(f"💾 Session Storage: {SESSION_STORAGE}")
+    print(f"🤖 Bot Token: {BOT_TOKEN[:20]}...")
+    print("=" * 50)
+    print("📡 Handlers turant serve karenge - readiness startup log aur /ready me")
+    print("Press Ctrl+C to stop")
+    print("=" * 50)
+    
+    app.run(main())